@@ -1,246 +1,490 @@
-from flask import Flask, render_template, request, jsonify #app's server
-import pandas as pd #data analysis
+import time
+_import_started = time.perf_counter()
+
+from flask import Flask, Request, render_template, request, jsonify, g #app's server
 import numpy as np #data analysis
 import pickle # saving the models
+import json
+import hashlib
 import os #operating system-> saving/ rewriting the files/ deleting
-import re #regex template
 from werkzeug.utils import secure_filename 
-from PIL import Image
-import cv2
-import easyocr 
-import pytesseract
-from pdf2image import convert_from_path
 import tempfile
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.preprocessing import LabelEncoder
+import gzip
+from forest_engine import export_forest
+from model_bundle import load_bundle, write_bundle, BundleError
+from caching import LRUCache, SQLiteCache, TieredCache
+from symptom_matcher import SymptomMatcher
+from symptom_search import SymptomIndex
+from symptom_set import SymptomVocabulary, SymptomSet
+from triage import TriageEngine
+import threading
+import ocr
+from ocr import extract_text_from_image, decode_image, iter_pdf_text
+from jobs import JobQueue, ThreadBackend, QueueFull
+from upload_buffer import UploadBuffer, SpoolFile
+import metrics
+from metrics import stage_timer
+from profiling import SlowRequestProfiler
+from logs import get_logger
+import subprocess
+import sys
+import functools
+import hmac
+from collections import namedtuple
+import training
 
 app = Flask(__name__)
+logger = get_logger('app')
 
 # Configuration
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 app.config['UPLOAD_FOLDER'] = 'uploads'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'tiff', 'pdf'}
+UPLOAD_SPOOL_THRESHOLD = 4 * 1024 * 1024  # uploads larger than this are spooled to disk
+MAX_BATCH_SIZE = 10000  # max patients per /predict/batch request
+PREDICTION_CACHE_SIZE = 4096  # max symptom sets kept in the prediction cache
+UPLOAD_WORKERS = 2  # uploads OCRed at the same time
+UPLOAD_QUEUE_SIZE = 16  # uploads waiting for a worker before /upload returns 503
+MODEL_BUNDLE_PATH = 'disease_model.bundle'  # memory-mapped model artifact
+OCR_CACHE_SIZE = 256  # OCR results kept in memory
+OCR_CACHE_DB = os.environ.get('OCR_CACHE_DB')  # SQLite file for a persistent OCR cache (unset = memory only)
+OCR_CACHE_MAX_BYTES = 256 * 1024 * 1024  # size limit of the SQLite tier
+OCR_CACHE_TTL = 7 * 24 * 3600  # seconds an OCR result stays valid
+JOB_STORE_DB = os.environ.get('JOB_STORE_DB')  # SQLite file shared by worker processes for /jobs polls (set by serve.py)
+JOB_TTL = 3600  # seconds a finished job stays available for polling
+SYMPTOMS_MAX_AGE = 300  # seconds browsers may reuse /api/symptoms before revalidating
+SYMPTOM_SEARCH_LIMIT = 20  # default results per /api/symptoms/search
+MAX_SYMPTOM_SEARCH_LIMIT = 200
+PROFILE_SLOW_REQUESTS = int(os.environ.get('PROFILE_SLOW_REQUESTS', '0'))  # profile the N slowest requests (0 = off)
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')  # bearer token for the admin routes (unset = admin routes disabled)
+RETRAIN_MAX_JOBS = os.cpu_count() or 1  # cores a retrain may use, whatever the request asks for
 
-# Create uploads directory if it doesn't exist
+# Create uploads directory if it doesn't exist (parent of the per-upload spool dirs)
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
-# Global variables for model and encoder
-model = None #trained random forest model
-encoder = None #label encoder for disease
-symptoms = None #list of sympotoms
+class UploadRequest(Request):
+    """Keeps uploaded files in memory up to UPLOAD_SPOOL_THRESHOLD (werkzeug spools above 500KB)
+    
+    Larger files go straight to a private spool dir that UploadBuffer takes over, so they are written once.
+    """
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return SpoolFile(UPLOAD_SPOOL_THRESHOLD, app.config['UPLOAD_FOLDER'])
+
+app.request_class = UploadRequest
+
+# Global variables for the model
+current_model = None #ModelState used by new requests, replaced as a whole on reload
+NO_SYMPTOMS = SymptomVocabulary(()).empty #returned by extract_symptoms_from_text while no model is loaded
+model_versions = 0 #number of models installed since startup
+
+# Per-class response data, serialized once per model load
+ClassInfo = namedtuple('ClassInfo', ['name', 'description', 'name_json', 'description_json'])
+
+# Seconds spent in each startup stage
+startup_timings = {}
+
+# /predict responses keyed on model version and symptom bitmask
+prediction_cache = LRUCache(PREDICTION_CACHE_SIZE)
+
+# OCR text and symptoms keyed on vocabulary and file (or PDF page) content hash
+ocr_cache = TieredCache(
+    OCR_CACHE_SIZE,
+    SQLiteCache(OCR_CACHE_DB, OCR_CACHE_MAX_BYTES, OCR_CACHE_TTL) if OCR_CACHE_DB else None,
+    OCR_CACHE_TTL
+)
+
+# Job snapshots shared by all worker processes, so any of them can answer a poll
+job_store = SQLiteCache(JOB_STORE_DB, ttl=JOB_TTL) if JOB_STORE_DB else None
+
+# Background OCR jobs for /upload, polled through /jobs/<id>
+upload_jobs = JobQueue(ThreadBackend(workers=UPLOAD_WORKERS, max_pending=UPLOAD_QUEUE_SIZE), JOB_TTL, job_store)
+
+# Serializes building the triage engine of a model
+triage_lock = threading.Lock()
+
+# Background retraining for /admin/retrain: one running, one waiting at most
+retrain_jobs = JobQueue(ThreadBackend(workers=1, max_pending=1), JOB_TTL, job_store)
+
+# Request latency per route, exposed at /metrics with the stage timers
+REQUEST_SECONDS = metrics.histogram('http_request_duration_seconds', 'Request latency', ['route', 'method', 'status'])
+
+# Sampling profiler for the slowest requests, toggled through /debug/profile
+profiler = SlowRequestProfiler(keep=PROFILE_SLOW_REQUESTS or 10)
+if PROFILE_SLOW_REQUESTS:
+    profiler.enable()
+
+class ModelState:
+    """A loaded model and everything derived from it; never modified once built
+    
+    Requests read current_model once and use that object throughout, so a
+    reload swapping in a new state never changes a model under a request.
+    """
+    
+    def __init__(self, forest, names, symptom_names, checksum, version, extras=None):
+        self.engine = forest.prepare() #flattened forest used for inference, leaf bitsets built before any fork
+        self.class_names = np.asarray(names) #disease name per class index
+        self.class_table = build_class_table(forest, self.class_names) #ClassInfo per engine output column
+        self.symptoms = list(symptom_names) #list of sympotoms
+        self.vocabulary = SymptomVocabulary(self.symptoms) #names <-> columns for SymptomSets
+        self.symptom_index = self.vocabulary.index #symptom name -> feature column
+        self.symptom_matcher = SymptomMatcher(self.symptoms) #Aho-Corasick automaton over the symptom names
+        self.checksum = checksum #checksum of the model bundle
+        self.vocabulary_hash = hashlib.sha256('\n'.join(self.symptoms).encode()).hexdigest()[:16] #namespaces the OCR cache
+        self.symptom_search = SymptomIndex(self.symptoms) #prefix/trigram index for /api/symptoms/search
+        self.symptoms_json = json.dumps({'symptoms': self.symptoms}).encode() + b'\n' #/api/symptoms body
+        self.symptoms_gzip = gzip.compress(self.symptoms_json, 9, mtime=0) #same body, compressed once
+        self.version = version
+        self.loaded_at = time.time()
+        self.triage = None #TriageEngine, built on the first /triage request
+        self.extras = extras or {} #bundle arrays from training, e.g. the symptom counts triage uses
+
+def use_model(forest, names, symptom_names, checksum=None, extras=None):
+    """Build the state for a model and swap it in for new requests"""
+    global current_model, model_versions
+    
+    state = ModelState(forest, names, symptom_names, checksum, model_versions + 1, extras)
+    model_versions = state.version
+    
+    # A single assignment: in-flight requests keep the state they started with
+    current_model = state
+    prediction_cache.clear()
+    
+    # Let the OCR cascade stop once a read already mentions enough symptoms
+    ocr.use_symptoms(state.symptoms, state.symptom_matcher)
+    return state
+
+def use_bundle(bundle):
+    """Swap in a loaded model bundle"""
+    return use_model(bundle.forest, bundle.class_names, bundle.symptoms, bundle.checksum, bundle.extras)
+
+def build_class_table(forest, names):
+    """Name, description and JSON fragments for each output column of the forest"""
+    table = []
+    for class_index in forest.classes:
+        name = str(names[class_index])
+        description = disease_info.get(name.strip(), '')
+        table.append(ClassInfo(name, description, to_json(name), to_json(description)))
+    return table
+
+def get_triage_engine(state):
+    """Triage engine for a model, built on first use from the training counts in its bundle"""
+    with triage_lock:
+        if state.triage is None:
+            if 'symptom_counts' in state.extras:
+                state.triage = TriageEngine.from_counts(state.engine, state.extras['symptom_counts'], state.extras['class_counts'])
+            else:
+                # Bundles converted from the pickles (or written before the counts were stored) have none
+                logger.warning("Model bundle has no training counts, using the training data on disk for triage")
+                state.triage = TriageEngine.from_dataset(state.engine, state.class_names, training.load_training_data())
+        return state.triage
 
-# Initialize EasyOCR reader
-reader = None
+def to_json(value):
+    """Compact JSON, same format as jsonify"""
+    return json.dumps(value, separators=(',', ':'))
 
 def load_model():
-    """Load the trained model from pickle files"""
-    global model, encoder, symptoms, reader
+    """Load the model bundle, falling back to the legacy pickle files"""
+    try:
+        # Memory-mapped bundle: no sklearn import, pages shared between processes
+        bundle = load_bundle(MODEL_BUNDLE_PATH)
+        state = use_bundle(bundle)
+        
+        logger.info("Model bundle loaded", extra={'symptoms': len(state.symptoms), 'diseases': len(state.class_names)})
+    
+    except (OSError, BundleError) as e:
+        logger.warning("Could not load model bundle, trying pickle files", extra={'error': str(e)})
+        
+        if not load_legacy_model():
+            logger.info("Retraining model from scratch")
+            
+            # Retrain the model
+            if not retrain_model():
+                logger.error("Failed to retrain model")
+                return False
     
+    # Load the EasyOCR reader in the background; /predict doesn't need it
+    ocr.start_warmup()
+    
+    return True
+
+def load_legacy_model():
+    """Load the trained model from pickle files and convert it to a bundle"""
     try:
         # Try to load the saved model
-        with open('disease_model.pkl', 'rb') as f:
+        with open(training.MODEL_PATH, 'rb') as f:
             model = pickle.load(f)
         
         # Load the label encoder
-        with open('label_encoder.pkl', 'rb') as f:
+        with open(training.ENCODER_PATH, 'rb') as f:
             encoder = pickle.load(f)
         
         # Load the symptom names
-        with open('symptom_names.pkl', 'rb') as f:
-            symptoms = pickle.load(f)
+        with open(training.SYMPTOMS_PATH, 'rb') as f:
+            legacy_symptoms = pickle.load(f)
         
-        print(f"Model loaded successfully!")
-        print(f"Number of symptoms: {len(symptoms)}")
-        print(f"Number of diseases: {len(encoder.classes_)}")
-    
+        # Flatten the forest for fast NumPy-only inference
+        forest = export_forest(model)
+        checksum = save_bundle(forest, encoder.classes_, legacy_symptoms)
+        state = use_model(forest, encoder.classes_, legacy_symptoms, checksum)
         
-    except Exception as e:
-        print(f"Error loading saved model: {e}")
-        print("Retraining model from scratch...")
+        logger.info("Model loaded from pickle files", extra={'symptoms': len(state.symptoms), 'diseases': len(state.class_names)})
+        return True
         
-        # Retrain the model
-        if retrain_model():
-            print("Model retrained successfully!")
-        else:
-            print("Failed to retrain model.")
-            return False
-    
-    # Initialize EasyOCR reader
-    try:
-        reader = easyocr.Reader(['en'])
     except Exception as e:
-        print(f"Warning: EasyOCR initialization failed: {e}")
-        reader = None
-    
-    return True
+        logger.warning("Error loading saved model", extra={'error': str(e)})
+        return False
 
+def save_bundle(forest, names, symptom_names):
+    """Write the model bundle for the next start; failure only costs startup time"""
+    try:
+        return write_bundle(MODEL_BUNDLE_PATH, forest, names, symptom_names)
+    except OSError as e:
+        logger.warning("Could not write model bundle", extra={'error': str(e)})
+        return None
 
-#Load pre-trained model components from pickle files
+
+#Load pre-trained model components from the bundle or pickle files
 #handle the cases where model files are missing by retraining
-#initialize ocr reader with error handling
+#warm up the ocr reader in the background
 
 
 def retrain_model():
-    """Retrain the model from the training data"""
-    global model, encoder, symptoms
-    
+    """Retrain the model from the training data (blocking, used at startup)"""
     try:
-        # Load training data
-        df = pd.read_csv("Training.csv")
-        
-        # Remove the unnamed column if it exists
-        if "Unnamed: 133" in df.columns:
-            df = df.drop("Unnamed: 133", axis=1)
-        
-        # Prepare data
-        encoder = LabelEncoder()
-        df["prognosis"] = encoder.fit_transform(df["prognosis"])
-        
-        X = df.drop("prognosis", axis=1).values
-        y = df["prognosis"].values
-        
-        # Train the model (same parameters as in notebook)
-        model = RandomForestClassifier(
-            n_estimators=100,
-            min_samples_split=2,
-            random_state=67
-        )
-        model.fit(X, y)
+        summary = training.train_and_save(MODEL_BUNDLE_PATH)
+        bundle = load_bundle(MODEL_BUNDLE_PATH)
+        state = use_bundle(bundle)
         
-        # Get symptom names
-        symptoms = df.drop("prognosis", axis=1).columns.tolist()
-        
-        # Save the new model
-        with open('disease_model.pkl', 'wb') as f:
-            pickle.dump(model, f)
-        
-        with open('label_encoder.pkl', 'wb') as f:
-            pickle.dump(encoder, f)
-        
-        with open('symptom_names.pkl', 'wb') as f:
-            pickle.dump(symptoms, f)
-        
-        print(f"Model retrained and saved successfully!")
-        print(f"Number of symptoms: {len(symptoms)}")
-        print(f"Number of diseases: {len(encoder.classes_)}")
+        logger.info("Model retrained and saved", extra={'seconds': summary['seconds'], 'symptoms': len(state.symptoms), 'diseases': len(state.class_names)})
         
         return True
         
-    except Exception as e:
-        print(f"Error retraining model: {e}")
+    except Exception:
+        logger.exception("Error retraining model")
         return False
 
+def run_retrain(job, rows, extra_trees, n_jobs):
+    """Background job: train in a separate process, then swap the new model in
+    
+    Training runs as its own process (training.py) so it can use every core
+    without holding this process's GIL; requests keep being served by the
+    current model until the new bundle is loaded and swapped in.
+    """
+    started = time.perf_counter()
+    options = {'bundle_path': MODEL_BUNDLE_PATH, 'rows': rows, 'extra_trees': extra_trees, 'n_jobs': n_jobs}
+    
+    # stderr goes to a file so a chatty child can't block on a full pipe
+    with tempfile.TemporaryFile(mode='w+') as errors:
+        process = subprocess.Popen(
+            [sys.executable, os.path.abspath(training.__file__)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=errors, text=True
+        )
+        process.stdin.write(json.dumps(options))
+        process.stdin.close()
+        
+        # training.py reports one JSON object per stage; anything else it prints is logged
+        summary = None
+        try:
+            for line in process.stdout:
+                try:
+                    report = json.loads(line)
+                except ValueError:
+                    report = None
+                if not isinstance(report, dict) or 'stage' not in report:
+                    logger.warning("Unexpected training output", extra={'line': line.strip()[:200]})
+                elif report['stage'] == 'done':
+                    summary = report['summary']
+                else:
+                    report['seconds'] = round(time.perf_counter() - started, 3)
+                    job.update(progress=report)
+        except BaseException:
+            process.kill()
+            raise
+        finally:
+            # Always reap the child, even when reading its output failed
+            process.stdout.close()
+            process.wait()
+        
+        if process.returncode != 0 or summary is None:
+            errors.seek(0)
+            lines = errors.read().strip().splitlines()
+            raise RuntimeError(f"Training failed: {lines[-1] if lines else process.returncode}")
+    
+    job.update(progress={'stage': 'loading', 'seconds': round(time.perf_counter() - started, 3)})
+    swap_started = time.perf_counter()
+    bundle = load_bundle(MODEL_BUNDLE_PATH)
+    state = use_bundle(bundle)
+    
+    summary['model_version'] = state.version
+    summary['swap_seconds'] = round(time.perf_counter() - swap_started, 3)
+    summary['total_seconds'] = round(time.perf_counter() - started, 3)
+    logger.info("Model retrained and swapped in", extra={'model_version': state.version, 'mode': summary['mode'], 'n_estimators': summary['n_estimators'], 'seconds': summary['total_seconds']})
+    return summary
+
+def admin_required(view):
+    """Only serve the route to requests with "Authorization: Bearer <ADMIN_TOKEN>"; off when no token is set"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not ADMIN_TOKEN:
+            return jsonify({'error': 'Admin routes are disabled; set ADMIN_TOKEN to enable them'}), 403
+        supplied = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(supplied.encode(), f'Bearer {ADMIN_TOKEN}'.encode()):
+            return jsonify({'error': 'Unauthorized'}), 401, {'WWW-Authenticate': 'Bearer'}
+        return view(*args, **kwargs)
+    return wrapper
+
 def allowed_file(filename):
     """Check if file extension is allowed"""
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def extract_text_from_image(image_path):
-    """Extract text from image using multiple OCR methods"""
-    try:
-        extracted_text = ""
-        
-        # Method 1: EasyOCR (if available)
-        if reader:
-            try:
-                results = reader.readtext(image_path)
-                # RESULTS->  TEXT
-                easyocr_text = ' '.join([text[1] for text in results])
-                extracted_text += easyocr_text + "\n"
-            except Exception as e:
-                print(f"EasyOCR failed: {e}")
-        
-        # Method 2: Tesseract OCR
-        try:
-            image = Image.open(image_path)
-            tesseract_text = pytesseract.image_to_string(image)
-            extracted_text += tesseract_text + "\n"
-        except Exception as e:
-            print(f"Tesseract failed: {e}")
-        
-        # Method 3: OpenCV preprocessing + Tesseract
+def is_symptom_list(value):
+    """Check that a request field is a list of symptom names"""
+    return isinstance(value, list) and all(isinstance(symptom, str) for symptom in value)
+
+def int_field(value):
+    """A request field as an int (JSON integer or integer string), or None"""
+    if isinstance(value, str):
         try:
-            img = cv2.imread(image_path)
-            if img is not None:
-                gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-                thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
-                
-                # Save preprocessed image temporarily
-                temp_path = os.path.join(app.config['UPLOAD_FOLDER'], 'temp_preprocessed.png')
-                cv2.imwrite(temp_path, thresh)
-                
-                preprocessed_text = pytesseract.image_to_string(Image.open(temp_path))
-                extracted_text += preprocessed_text + "\n"
-                
-                # Clean up
-                if os.path.exists(temp_path):
-                    os.remove(temp_path)
-        except Exception as e:
-            print(f"OpenCV preprocessing failed: {e}")
-        
-        return extracted_text.strip()
-        
-    except Exception as e:
-        print(f"Error extracting text from image: {e}")
-        return ""
+            value = int(value.strip())
+        except ValueError:
+            return None
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    return None
+
+def positive_int(value):
+    """A request field as a positive int, or None"""
+    number = int_field(value)
+    return number if number is not None and number > 0 else None
+
+def extract_symptoms_from_text(text, state=None):
+    """Extract symptoms from extracted text as a SymptomSet"""
+    state = state or current_model
+    if state is None:
+        return NO_SYMPTOMS
+    if not text:
+        return state.vocabulary.empty
+    
+    # Single pass over the text for all symptom names and their significant words
+    with stage_timer('symptom_match'):
+        return state.vocabulary.from_indices(state.symptom_matcher.match_indices(text))
+
+def build_feature_matrix(state, symptom_lists):
+    """Build a uint8 feature matrix (one row per patient) from SymptomSets or symptom name lists"""
+    vocabulary = state.vocabulary
+    symptom_sets = [
+        selected if isinstance(selected, SymptomSet) else vocabulary.encode(selected)
+        for selected in symptom_lists
+    ]
+    return vocabulary.matrix(symptom_sets)
+
+def top_k_predictions(probabilities, k=3):
+    """Return the k most likely class indices per row, most likely first"""
+    k = max(1, min(k, probabilities.shape[1]))
+    
+    # argpartition finds the top k per row, then only those k get sorted
+    top = np.argpartition(-probabilities, k - 1, axis=1)[:, :k]
+    top_probs = np.take_along_axis(probabilities, top, axis=1)
+    order = np.lexsort((top, -top_probs), axis=1)
+    return np.take_along_axis(top, order, axis=1)
+
+def score_feature_matrix(state, features, k=3, include_description=False):
+    """Score a feature matrix with one predict_proba call and render per-row results"""
+    with stage_timer('inference'):
+        probabilities = state.engine.predict_proba(features)
+    
+    # Same winner as model.predict, without a second pass over the forest
+    predictions = probabilities.argmax(axis=1)
+    top_indices = top_k_predictions(probabilities, k)
+    
+    confidences = np.round(probabilities[np.arange(len(predictions)), predictions] * 100, 2)
+    top_confidences = np.round(np.take_along_axis(probabilities, top_indices, axis=1) * 100, 2)
+    
+    with stage_timer('render'):
+        return [
+            render_prediction(state.class_table, prediction, confidence, row_indices, row_confidences, include_description)
+            for prediction, confidence, row_indices, row_confidences
+            in zip(predictions.tolist(), confidences.tolist(), top_indices.tolist(), top_confidences.tolist())
+        ]
+
+def render_prediction(class_table, prediction, confidence, top_indices, top_confidences, include_description=False):
+    """JSON for one scored row as (head, tail), split where "selected_symptoms" goes
+    
+    Built from the class table's pre-serialized fragments, with keys in the
+    sorted order jsonify uses.
+    """
+    info = class_table[prediction]
+    head = '{"confidence":' + repr(confidence)
+    if include_description:
+        head += ',"description":' + info.description_json
+    head += ',"prediction":' + info.name_json + ','
+    
+    top = ','.join(
+        '{"confidence":' + repr(value) + ',"disease":' + class_table[index].name_json + '}'
+        for index, value in zip(top_indices, top_confidences)
+    )
+    tail = '"top_predictions":[' + top + ']}'
+    return head, tail
+
+def json_response(body, status=200):
+    """Response for an already serialized JSON body"""
+    return app.response_class(body + '\n', status=status, mimetype='application/json')
 
-def extract_text_from_pdf(pdf_path):
-    """Extract text from PDF file"""
+def process_upload(job, upload):
+    """Background job: OCR an uploaded file and extract its symptoms"""
+    state = current_model
+    
+    # Same bytes and same symptom vocabulary: reuse the earlier result
+    cache_key = f'{state.vocabulary_hash}:file:{upload.content_hash()}'
+    cached = ocr_cache.get(cache_key)
+    if cached is not None:
+        upload.cleanup()
+        return upload_result(cached['text'], cached['found_symptoms'], cached=True)
+    
     try:
-        # Convert PDF to images
-        images = convert_from_path(pdf_path)
-        text_content = []
-        
-        for i, image in enumerate(images):
-            # Save image temporarily
-            temp_path = os.path.join(app.config['UPLOAD_FOLDER'], f'temp_pdf_page_{i}.png')
-            image.save(temp_path, 'PNG')
-            
-            # Extract text from image
-            page_text = extract_text_from_image(temp_path)
-            text_content.append(page_text)
-            
-            # Clean up
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-        
-        return '\n'.join(text_content)
-        
-    except Exception as e:
-        print(f"Error extracting text from PDF: {e}")
-        return ""
-
-def extract_symptoms_from_text(text):
-    """Extract symptoms from extracted text"""
-    if not text or not symptoms:
-        return []
-    
-    # Convert text to lowercase for matching
-    text_lower = text.lower()
-    
-    # Find matching symptoms
-    found_symptoms = []
-    for symptom in symptoms:
-        # Convert symptom name to readable format
-        symptom_readable = symptom.replace('_', ' ').lower()
-        
-        # Check for exact matches and variations
-        if symptom_readable in text_lower:
-            found_symptoms.append(symptom)
-        elif symptom in text_lower:
-            found_symptoms.append(symptom)
-        else:
-            # Check for partial matches
-            words = symptom_readable.split()
-            if any(word in text_lower for word in words if len(word) > 3):
-                found_symptoms.append(symptom)
+        # Extract text based on file type
+        with profiler.track('job:upload'), stage_timer('ocr'):
+            if upload.filename.lower().endswith('.pdf'):
+                # poppler reads PDFs from a file, so these always get a private temp dir
+                pages = []
+                for page_text in iter_pdf_text(upload.path(), cache=ocr_cache, namespace=state.vocabulary_hash):
+                    pages.append(page_text)
+                    job.update(
+                        progress={'pages_done': len(pages)},
+                        partial={'found_symptoms': extract_symptoms_from_text('\n'.join(pages), state).names()}
+                    )
+                extracted_text = '\n'.join(pages)
+            else:
+                # Decoded once from memory; all OCR engines read the same array
+                try:
+                    pixels = decode_image(upload.source())
+                except Exception:
+                    raise ValueError('Could not read image file')
+                extracted_text = extract_text_from_image(pixels)
+    finally:
+        # Clean up the spooled copy, if any
+        upload.cleanup()
+    
+    if not extracted_text:
+        raise ValueError('Could not extract text from file')
     
-    # Remove duplicates and return
-    return list(set(found_symptoms))
+    # Extract symptoms from text
+    found_symptoms = extract_symptoms_from_text(extracted_text, state).names()
+    ocr_cache.put(cache_key, {'text': extracted_text, 'found_symptoms': found_symptoms})
+    
+    return upload_result(extracted_text, found_symptoms)
 
-# Load model on startup
-if not load_model():
-    print("Failed to load model. Please ensure all pickle files are present.")
+def upload_result(extracted_text, found_symptoms, cached=False):
+    """Job result for a processed upload"""
+    return {
+        'success': True,
+        'extracted_text': extracted_text[:500] + '...' if len(extracted_text) > 500 else extracted_text,
+        'found_symptoms': found_symptoms,
+        'symptom_count': len(found_symptoms),
+        'cached': cached
+    }
 
 # Disease descriptions
 disease_info = {
@@ -287,10 +531,37 @@ disease_info = {
     'Impetigo': 'A highly contagious skin infection that mainly affects infants and children. Symptoms include skin rash and high fever.'
 }
 
+# Load model on startup
+startup_timings['imports'] = round(time.perf_counter() - _import_started, 3)
+_load_started = time.perf_counter()
+if not load_model():
+    logger.error("Failed to load model. Please ensure all pickle files are present.")
+startup_timings['load_model'] = round(time.perf_counter() - _load_started, 3)
+startup_timings['ready_for_predict'] = round(time.perf_counter() - _import_started, 3)
+logger.info("Startup complete", extra={'startup_timings': startup_timings})
+
+
+@app.before_request
+def start_request_timer():
+    """Time every request and sample its stacks when profiling is on"""
+    g.started = time.perf_counter()
+    g.profile = profiler.start(f'{request.method} {request.path}')
+
+@app.after_request
+def record_request_time(response):
+    """Feed the request latency histogram"""
+    started = g.get('started')
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_SECONDS.observe(time.perf_counter() - started, route=route, method=request.method, status=response.status_code)
+        profiler.finish(g.get('profile'))
+    return response
+
 @app.route('/')
 def index():
     """Homepage"""
-    return render_template('index.html', symptoms=symptoms)
+    # The page loads the symptom list from /api/symptoms, which browsers cache
+    return render_template('index.html')
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
@@ -306,46 +577,38 @@ def upload_file():
         if not allowed_file(file.filename):
             return jsonify({'error': 'File type not allowed'}), 400
         
-        # Save uploaded file
-        print(app.config['UPLOAD_FOLDER'])
+        # Keep the upload in memory; only large files go to a private temp dir
         filename = secure_filename(file.filename)
+        with stage_timer('upload_save'):
+            upload = UploadBuffer.from_stream(file.stream, filename, UPLOAD_SPOOL_THRESHOLD, app.config['UPLOAD_FOLDER'])
         
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        
-        os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-        
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        
-        file.save(filepath)
-        
-        
-        
-        # Extract text based on file type
-        if filename.lower().endswith('.pdf'):
-            extracted_text = extract_text_from_pdf(filepath)
-        else:
-            extracted_text = extract_text_from_image(filepath)
-        
-        # Clean up uploaded file
-        if os.path.exists(filepath):
-            os.remove(filepath)
-        
-        if not extracted_text:
-            return jsonify({'error': 'Could not extract text from file'}), 400
-        
-        # Extract symptoms from text
-        found_symptoms = extract_symptoms_from_text(extracted_text)
+        # OCR runs in the background; the client polls /jobs/<id>
+        try:
+            job = upload_jobs.submit(process_upload, upload)
+        except QueueFull as e:
+            upload.cleanup()
+            return jsonify({'error': str(e)}), 503, {'Retry-After': '5'}
         
         return jsonify({
             'success': True,
-            'extracted_text': extracted_text[:500] + '...' if len(extracted_text) > 500 else extracted_text,
-            'found_symptoms': found_symptoms,
-            'symptom_count': len(found_symptoms)
-        })
+            'job_id': job.id,
+            'status': job.status,
+            'status_url': f'/jobs/{job.id}'
+        }), 202
         
     except Exception as e:
+        logger.exception("Request failed", extra={'route': request.path})
         return jsonify({'error': str(e)}), 500
 
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Status, progress and (once done) result of a background job"""
+    status = upload_jobs.status(job_id) or retrain_jobs.status(job_id)
+    if status is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    return jsonify(status)
+
 @app.route('/predict', methods=['POST'])
 def predict():
     """Predict disease based on symptoms"""
@@ -356,40 +619,130 @@ def predict():
         if not selected_symptoms:
             return jsonify({'error': 'No symptoms selected'}), 400
         
-        # Create feature vector
-        features = np.zeros(len(symptoms))
-        for symptom in selected_symptoms:
-            if symptom in symptoms:
-                idx = symptoms.index(symptom)
-                features[idx] = 1
+        include_description = bool(data.get('include_description', False))
+        state = current_model
         
-        # Make prediction
-        prediction = model.predict([features])[0]
-        disease = encoder.inverse_transform([prediction])[0]
+        # Identical symptom sets always get the same answer from the same model
+        symptoms = state.vocabulary.encode(selected_symptoms)
+        key = (state.version, symptoms.mask, include_description)
+        result = prediction_cache.get(key)
+        if result is None:
+            with stage_timer('feature_build'):
+                features = state.vocabulary.matrix([symptoms])
+            result = score_feature_matrix(state, features, k=3, include_description=include_description)[0]
+            prediction_cache.put(key, result)
         
-        # Get prediction probabilities
-        probabilities = model.predict_proba([features])[0]
+        head, tail = result
+        return json_response(head + '"selected_symptoms":' + to_json(selected_symptoms) + ',' + tail)
         
-        # Get top 3 predictions with their probabilities
-        top_indices = np.argsort(probabilities)[::-1][:3]
-        top_predictions = []
+    except Exception as e:
+        logger.exception("Request failed", extra={'route': request.path})
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    """Predict diseases for many patients in a single model call"""
+    try:
+        data = request.get_json()
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Request body must be a JSON object'}), 400
+        
+        patients = data.get('patients', [])
+        include_description = bool(data.get('include_description', False))
+        top_k = positive_int(data.get('top_k', 3))
+        if top_k is None:
+            return jsonify({'error': 'top_k must be a positive integer'}), 400
+        
+        if not patients:
+            return jsonify({'error': 'No patients provided'}), 400
+        
+        if not isinstance(patients, list):
+            return jsonify({'error': 'patients must be a list'}), 400
+        
+        if len(patients) > MAX_BATCH_SIZE:
+            return jsonify({'error': f'Batch size exceeds {MAX_BATCH_SIZE} patients'}), 400
+        
+        # Each patient is either a list of symptoms or {"symptoms": [...]}
+        symptom_lists = []
+        for i, patient in enumerate(patients):
+            selected = patient.get('symptoms', []) if isinstance(patient, dict) else patient
+            if not is_symptom_list(selected):
+                return jsonify({
+                    'error': f'Patient {i} must be a list of symptom names or {{"symptoms": [...]}}',
+                    'index': i
+                }), 400
+            symptom_lists.append(selected)
+        
+        # Patients without symptoms are reported but not scored
+        scored_rows = [i for i, selected in enumerate(symptom_lists) if selected]
+        results = ['{"error":"No symptoms selected"}'] * len(symptom_lists)
+        
+        if scored_rows:
+            state = current_model
+            with stage_timer('feature_build'):
+                symptom_sets = [state.vocabulary.encode(symptom_lists[i]) for i in scored_rows]
+                features = state.vocabulary.matrix(symptom_sets)
+            rendered = score_feature_matrix(state, features, k=top_k, include_description=include_description)
+            for i, (head, tail) in zip(scored_rows, rendered):
+                results[i] = head + tail
+        
+        return json_response('{"count":' + str(len(results)) + ',"predictions":[' + ','.join(results) + ']}')
+        
+    except Exception as e:
+        logger.exception("Request failed", extra={'route': request.path})
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/triage', methods=['POST'])
+def triage():
+    """Differential diagnosis plus the symptoms most worth asking about next"""
+    try:
+        data = request.get_json()
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Request body must be a JSON object'}), 400
         
-        for idx in top_indices:
-            disease_name = encoder.inverse_transform([idx])[0]
-            confidence = probabilities[idx] * 100
-            top_predictions.append({
-                'disease': disease_name,
-                'confidence': round(confidence, 2)
-            })
+        selected_symptoms = data.get('symptoms', [])
+        absent_symptoms = data.get('absent', [])
+        if not is_symptom_list(selected_symptoms) or not is_symptom_list(absent_symptoms):
+            return jsonify({'error': 'symptoms and absent must be lists of symptom names'}), 400
+        
+        top_k = positive_int(data.get('top_k', 5))
+        if top_k is None:
+            return jsonify({'error': 'top_k must be a positive integer'}), 400
+        
+        state = current_model
+        unknown = state.vocabulary.unknown(selected_symptoms + absent_symptoms)
+        if unknown:
+            return jsonify({'error': f'Unknown symptoms: {unknown}'}), 400
+        
+        present = state.vocabulary.encode(selected_symptoms)
+        absent = state.vocabulary.encode(absent_symptoms) - present
+        
+        engine = get_triage_engine(state)
+        with stage_timer('triage'):
+            result = engine.suggest(present.indices(), absent.indices(), top_k)
         
+        # Differential over the posterior that includes the denied symptoms
+        top_indices = top_k_predictions(result.posterior[None, :], top_k)[0]
         return jsonify({
-            'prediction': disease,
-            'confidence': round(probabilities[prediction] * 100, 2),
-            'top_predictions': top_predictions,
-            'selected_symptoms': selected_symptoms
+            'selected_symptoms': selected_symptoms,
+            'absent_symptoms': absent_symptoms,
+            'entropy': round(result.entropy, 4),
+            'differential': [
+                {'disease': state.class_table[i].name, 'confidence': round(float(result.posterior[i]) * 100, 2)}
+                for i in top_indices.tolist()
+            ],
+            'suggestions': [
+                {
+                    'symptom': state.symptoms[s.symptom],
+                    'information_gain': round(s.information_gain, 4),
+                    'p_yes': round(s.p_yes, 4)
+                }
+                for s in result.suggestions
+            ]
         })
         
     except Exception as e:
+        logger.exception("Request failed", extra={'route': request.path})
         return jsonify({'error': str(e)}), 500
 
 @app.route('/about')
@@ -400,8 +753,176 @@ def about():
 @app.route('/api/symptoms')
 def get_symptoms():
     """API endpoint to get all symptoms"""
-    return jsonify({'symptoms': symptoms})
+    state = current_model
+    if state is None:
+        return jsonify({'symptoms': None})
+    
+    # The list only changes with the vocabulary, so clients revalidate with the ETag;
+    # the gzip body is a different representation and gets its own
+    gzipped = bool(request.accept_encodings['gzip'])
+    etag = state.vocabulary_hash + ('-gzip' if gzipped else '')
+    response = app.response_class(mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f'public, max-age={SYMPTOMS_MAX_AGE}'
+    response.vary.add('Accept-Encoding')
+    if request.if_none_match.contains(etag):
+        response.status_code = 304
+        return response
+    
+    if gzipped:
+        response.set_data(state.symptoms_gzip)
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response.set_data(state.symptoms_json)
+    return response
+
+@app.route('/api/symptoms/search')
+def search_symptoms():
+    """Ranked, typo-tolerant symptom search"""
+    query = request.args.get('q', '')
+    limit = request.args.get('limit', SYMPTOM_SEARCH_LIMIT, type=int)
+    limit = max(1, min(limit, MAX_SYMPTOM_SEARCH_LIMIT))
+    state = current_model
+    
+    with stage_timer('symptom_search'):
+        results = state.symptom_search.search(query, limit)
+    
+    response = jsonify({
+        'query': query,
+        'results': [
+            {'symptom': r.symptom, 'tier': r.tier, 'similarity': round(r.similarity, 4)}
+            for r in results
+        ]
+    })
+    query_hash = hashlib.sha256(f'{limit}:{query}'.encode()).hexdigest()[:16]
+    response.set_etag(f'{state.vocabulary_hash}-{query_hash}')
+    response.headers['Cache-Control'] = f'public, max-age={SYMPTOMS_MAX_AGE}'
+    return response.make_conditional(request)
+
+@app.route('/api/cache/stats')
+def cache_stats():
+    """API endpoint to get prediction cache counters"""
+    return jsonify(prediction_cache.stats())
+
+@app.route('/admin/retrain', methods=['POST'])
+@admin_required
+def admin_retrain():
+    """Start a background retrain, optionally with new labelled rows"""
+    try:
+        data = request.get_json(silent=True) or {}
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Request body must be a JSON object'}), 400
+        
+        rows = data.get('rows', [])
+        extra_trees = int_field(data.get('extra_trees', 0))
+        n_jobs = int_field(data.get('n_jobs', -1))
+        allow_new_diseases = data.get('allow_new_diseases', False) is True
+        
+        if extra_trees is None or extra_trees < 0:
+            return jsonify({'error': 'extra_trees must be a non-negative integer'}), 400
+        if n_jobs is None:
+            return jsonify({'error': 'n_jobs must be an integer'}), 400
+        
+        # -1 (or any value out of range) means every core the server allows
+        if not 1 <= n_jobs <= RETRAIN_MAX_JOBS:
+            n_jobs = RETRAIN_MAX_JOBS
+        
+        if not isinstance(rows, list):
+            return jsonify({'error': 'rows must be a list'}), 400
+        
+        # Each row is {"symptoms": [...], "prognosis": "Disease name"} with known symptom names
+        state = current_model
+        known_diseases = set(state.class_names.tolist())
+        clean_rows = []
+        for i, row in enumerate(rows):
+            if (not isinstance(row, dict) or not isinstance(row.get('prognosis'), str) or not row['prognosis'].strip()
+                    or not is_symptom_list(row.get('symptoms')) or not row['symptoms']):
+                return jsonify({'error': f'Row {i} needs a non-empty "symptoms" list and a "prognosis"', 'index': i}), 400
+            unknown = state.vocabulary.unknown(row['symptoms'])
+            if unknown:
+                return jsonify({'error': f'Row {i} has unknown symptoms: {unknown}', 'index': i}), 400
+            
+            # Stored as sent, a stray space would become a new disease
+            prognosis = row['prognosis'].strip()
+            if prognosis not in known_diseases and not allow_new_diseases:
+                return jsonify({
+                    'error': f'Row {i} has an unknown prognosis {prognosis!r}; send "allow_new_diseases": true to add it',
+                    'index': i
+                }), 400
+            clean_rows.append({'symptoms': row['symptoms'], 'prognosis': prognosis})
+        
+        try:
+            job = retrain_jobs.submit(run_retrain, clean_rows, extra_trees, n_jobs)
+        except QueueFull:
+            return jsonify({'error': 'A retrain is already queued, try again later'}), 503, {'Retry-After': '30'}
+        
+        return jsonify({
+            'success': True,
+            'job_id': job.id,
+            'status': job.status,
+            'status_url': f'/jobs/{job.id}'
+        }), 202
+    
+    except Exception as e:
+        logger.exception("Request failed", extra={'route': request.path})
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/health/ready')
+def readiness():
+    """Readiness probe: which subsystems are loaded"""
+    state = current_model
+    model_ready = state is not None
+    status = {
+        'ready': model_ready,
+        'model_checksum': state.checksum if state else None,
+        'model_version': state.version if state else None,
+        'subsystems': {
+            'model': model_ready,
+            'ocr': ocr.ocr_status()
+        },
+        'startup_timings': startup_timings
+    }
+    return jsonify(status), 200 if model_ready else 503
+
+@app.route('/metrics')
+def get_metrics():
+    """Prometheus metrics: request latency, stage timers and OCR engine timings"""
+    return app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/debug/profile', methods=['GET', 'POST'])
+@admin_required
+def debug_profile():
+    """Toggle the slow-request profiler (POST) or fetch its profiles (GET)"""
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        if data.get('clear'):
+            profiler.clear()
+        if data.get('enabled', True):
+            profiler.enable(keep=int(data['keep']) if 'keep' in data else None)
+        else:
+            profiler.disable()
+    
+    # Collapsed stacks for flamegraph.pl / speedscope
+    if request.args.get('format') == 'folded':
+        return app.response_class(profiler.folded(), mimetype='text/plain')
+    
+    return jsonify({
+        'enabled': profiler.enabled,
+        'keep': profiler.keep,
+        'profiles': [
+            {'label': profile['label'], 'seconds': profile['seconds'], 'samples': sum(profile['samples'].values())}
+            for profile in profiler.slowest()
+        ]
+    })
+
+@app.route('/api/ocr/stats')
+def get_ocr_stats():
+    """API endpoint to get per-engine OCR timings and OCR cache counters"""
+    stats = ocr.ocr_stats()
+    stats['cache'] = ocr_cache.stats()
+    return jsonify(stats)
 
 if __name__ == '__main__':
+    # Development server; serve.py (prefork workers) or asgi.py for production
     # Use port 5001 to avoid conflicts with AirPlay Receiver
     app.run(debug=True, host='0.0.0.0', port=5001) 
\ No newline at end of file
@@ -0,0 +1,246 @@
+"""
+Async (ASGI) entry point around the Flask app.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5001
+
+The ASGI server (uvicorn, hypercorn, ...) holds the connections, so thousands
+of idle keep-alive clients cost no threads. Each request is handed to the
+same Flask handlers through a small WSGI bridge:
+
+  - cheap routes (/predict, /api/symptoms, pages, health, stats, job polling)
+    run inline on the event loop; they take about a millisecond
+  - /predict/batch runs on the "batch" thread pool and everything else
+    (uploads, retrain, static files) on the "blocking" pool
+
+Each pool has a concurrency limit and a deadline. A request that cannot
+get a slot before its deadline gets 503, and one that does not finish in
+time gets 504. OCR itself already runs in the background job queue and its
+process pool.
+
+The pools are threads in the event loop's process, so they only keep the
+loop free while they wait or run code that releases the GIL. A large
+/predict/batch is scored with NumPy, which releases it only inside its
+larger array operations, and its parsing, encoding and rendering hold the
+GIL throughout, delaying the inline routes meanwhile. For heavy batch traffic, run several processes
+(serve.py, or the ASGI server's own workers).
+
+Request bodies are read completely before dispatch. A client that
+disconnects before sending all of its body gets no response, and its
+request never reaches Flask.
+"""
+
+import asyncio
+import io
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+from app import app as flask_app
+
+# Configuration
+INLINE_ROUTES = {'/', '/about', '/predict', '/api/symptoms', '/api/symptoms/search', '/api/cache/stats',
+                 '/api/ocr/stats', '/health/ready', '/metrics'}
+INLINE_PREFIXES = ('/jobs/',)
+BATCH_ROUTES = {'/predict/batch'}
+BATCH_WORKERS = int(os.environ.get('ASGI_BATCH_WORKERS', os.cpu_count() or 1))  # concurrent batch requests
+BATCH_DEADLINE = float(os.environ.get('ASGI_BATCH_DEADLINE', '30'))  # seconds
+BLOCKING_WORKERS = int(os.environ.get('ASGI_BLOCKING_WORKERS', '8'))  # concurrent uploads and other slow requests
+BLOCKING_DEADLINE = float(os.environ.get('ASGI_BLOCKING_DEADLINE', '30'))  # seconds
+
+REJECTED = metrics.counter('asgi_rejected_total', 'Requests rejected by the ASGI pools', ['pool', 'reason'])
+
+
+class ClientDisconnected(Exception):
+    """The client went away before its request body was complete"""
+
+
+class Pool:
+    """Thread pool with a concurrency limit and a per-request deadline"""
+
+    def __init__(self, name, workers, deadline):
+        self.name = name
+        self.workers = workers
+        self.deadline = deadline
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'asgi-{name}')
+        self._slots = None
+
+    @property
+    def slots(self):
+        # Created on first use so it belongs to the running event loop
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+        return self._slots
+
+
+def build_environ(scope, body):
+    """WSGI environ for an ASGI HTTP scope and its complete body"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': str(server[0]),
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif name in ('CONTENT_LENGTH', 'TRANSFER_ENCODING'):
+            continue  # the body is already buffered and de-chunked; its length is set above
+        else:
+            key = f'HTTP_{name}'
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+def call_wsgi(wsgi_app, environ):
+    """Run a WSGI app to completion and return (status code, headers, body)"""
+    response = {}
+    chunks = []
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = headers
+        return chunks.append
+
+    result = wsgi_app(environ, start_response)
+    try:
+        for chunk in result:
+            if chunk:
+                chunks.append(chunk)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+
+    return response['status'], response['headers'], b''.join(chunks)
+
+
+def error_response(status, message, headers=()):
+    body = (json.dumps({'error': message}, separators=(',', ':')) + '\n').encode('utf-8')
+    return status, [('Content-Type', 'application/json'), *headers], body
+
+
+class ASGIApp:
+    """ASGI application dispatching to the Flask app inline or on a pool"""
+
+    def __init__(self, wsgi_app, max_body=None):
+        self.wsgi_app = wsgi_app
+        self.max_body = max_body
+        self.batch = Pool('batch', BATCH_WORKERS, BATCH_DEADLINE)
+        self.blocking = Pool('blocking', BLOCKING_WORKERS, BLOCKING_DEADLINE)
+
+    def pool_for(self, path):
+        """None for routes served inline on the event loop"""
+        if path in INLINE_ROUTES or path.startswith(INLINE_PREFIXES):
+            return None
+        if path in BATCH_ROUTES:
+            return self.batch
+        return self.blocking
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        try:
+            body = await self.read_body(receive)
+        except ClientDisconnected:
+            return
+        if body is None:
+            response = error_response(413, 'Request body too large')
+        else:
+            environ = build_environ(scope, body)
+            pool = self.pool_for(scope['path'])
+            if pool is None:
+                response = call_wsgi(self.wsgi_app, environ)
+            else:
+                response = await self.run_pooled(pool, environ)
+
+        status, headers, content = response
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+        })
+        await send({'type': 'http.response.body', 'body': content})
+
+    async def read_body(self, receive):
+        """The whole request body, or None if it exceeds max_body
+
+        Raises ClientDisconnected if the client leaves before the body is complete.
+        """
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                raise ClientDisconnected()
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if self.max_body is not None and size > self.max_body:
+                return None
+            chunks.append(chunk)
+            if not message.get('more_body', False):
+                break
+        return b''.join(chunks)
+
+    async def run_pooled(self, pool, environ):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + pool.deadline
+
+        # Waiting for a slot counts toward the deadline
+        try:
+            await asyncio.wait_for(pool.slots.acquire(), pool.deadline)
+        except asyncio.TimeoutError:
+            REJECTED.inc(pool=pool.name, reason='busy')
+            return error_response(503, 'Server busy, try again later', [('Retry-After', '5')])
+
+        future = loop.run_in_executor(pool.executor, call_wsgi, self.wsgi_app, environ)
+        # A thread can't be interrupted, so the slot is freed when the work really ends
+        future.add_done_callback(lambda _: pool.slots.release())
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), max(deadline - loop.time(), 0))
+        except asyncio.TimeoutError:
+            REJECTED.inc(pool=pool.name, reason='deadline')
+            return error_response(504, f'Request did not finish within {pool.deadline:g}s')
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.batch.executor.shutdown(wait=False)
+                self.blocking.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+app = ASGIApp(flask_app, max_body=flask_app.config.get('MAX_CONTENT_LENGTH'))
+
+if __name__ == '__main__':
+    try:
+        import uvicorn
+    except ImportError:
+        sys.exit("uvicorn is not installed: pip install uvicorn, or serve asgi:app with any ASGI server")
+
+    uvicorn.run(app, host='0.0.0.0', port=5001)
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for prediction, symptom extraction and OCR.
+
+Measures, in-process against the real app and model:
+  - /predict latency and throughput at several concurrency levels (Flask test client)
+  - batch scoring rows/s on Testing.csv and on synthetic symptom sets
+  - extract_symptoms_from_text on large synthetic texts
+  - OCR seconds per page on generated images (skipped without Tesseract)
+
+Results are written as JSON. Given a baseline file from an earlier run, every
+metric is compared and the script exits with status 1 if any got worse by
+more than the threshold:
+
+    python benchmark.py --output baseline.json
+    python benchmark.py --baseline baseline.json --threshold 0.15
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+SEED = 67
+CONCURRENCY_LEVELS = [1, 8, 64]
+DEFAULT_THRESHOLD = 0.10  # relative change counted as a regression
+
+FILLER_WORDS = ['patient', 'reports', 'the', 'and', 'with', 'since', 'days', 'noted', 'history', 'of',
+                'no', 'known', 'allergies', 'examination', 'shows', 'mild', 'severe', 'left', 'right', 'on']
+
+
+def metric(value, unit, better):
+    """One measured value; better is 'lower' or 'higher'"""
+    return {'value': round(float(value), 6), 'unit': unit, 'better': better}
+
+
+def latency_metrics(prefix, latencies, wall_seconds):
+    latencies = np.asarray(latencies) * 1000
+    return {
+        f'{prefix}.p50_ms': metric(np.percentile(latencies, 50), 'ms', 'lower'),
+        f'{prefix}.p95_ms': metric(np.percentile(latencies, 95), 'ms', 'lower'),
+        f'{prefix}.p99_ms': metric(np.percentile(latencies, 99), 'ms', 'lower'),
+        f'{prefix}.requests_per_s': metric(len(latencies) / wall_seconds, 'req/s', 'higher'),
+    }
+
+
+def random_symptom_sets(symptoms, count, rng, min_size=1, max_size=6):
+    """Random symptom name lists"""
+    sizes = rng.integers(min_size, max_size + 1, size=count)
+    return [list(rng.choice(symptoms, size=size, replace=False)) for size in sizes]
+
+
+def bench_predict(app_module, requests_per_level, rng):
+    """/predict latency/throughput per concurrency level, on cache misses"""
+    results = {}
+    state = app_module.current_model
+
+    for concurrency in CONCURRENCY_LEVELS:
+        payloads = random_symptom_sets(state.symptoms, requests_per_level, rng)
+        app_module.prediction_cache.clear()
+        clients = [app_module.app.test_client() for _ in range(concurrency)]
+
+        def worker(index):
+            client = clients[index]
+            latencies = []
+            for payload in payloads[index::concurrency]:
+                start = time.perf_counter()
+                response = client.post('/predict', json={'symptoms': payload})
+                latencies.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    raise RuntimeError(f"/predict returned {response.status_code}")
+            return latencies
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            latencies = [value for chunk in pool.map(worker, range(concurrency)) for value in chunk]
+        wall = time.perf_counter() - start
+
+        results.update(latency_metrics(f'predict.c{concurrency}', latencies, wall))
+
+    return results
+
+
+def bench_batch(app_module, synthetic_rows, repeats, rng):
+    """Rows/s through build_feature_matrix + score_feature_matrix"""
+    from dataset import load_dataset
+
+    state = app_module.current_model
+    testing = load_dataset('Testing.csv', cache=False)
+    testing_sets = [[testing.symptoms[i] for i in np.flatnonzero(row)] for row in testing.features]
+    synthetic_sets = random_symptom_sets(state.symptoms, synthetic_rows, rng)
+
+    results = {}
+    for name, symptom_lists in (('testing_csv', testing_sets), ('synthetic', synthetic_sets)):
+        best = float('inf')
+        for _ in range(repeats):
+            start = time.perf_counter()
+            features = app_module.build_feature_matrix(state, symptom_lists)
+            app_module.score_feature_matrix(state, features, k=3)
+            best = min(best, time.perf_counter() - start)
+        results[f'batch.{name}.rows_per_s'] = metric(len(symptom_lists) / best, 'rows/s', 'higher')
+
+    return results
+
+
+def synthetic_text(symptoms, size, rng):
+    """Report-like text of about size characters mentioning some symptoms"""
+    readable = [symptom.replace('_', ' ') for symptom in symptoms]
+    words = []
+    length = 0
+    while length < size:
+        if rng.random() < 0.05:
+            word = readable[rng.integers(len(readable))]
+        else:
+            word = FILLER_WORDS[rng.integers(len(FILLER_WORDS))]
+        words.append(word)
+        length += len(word) + 1
+    return ' '.join(words)
+
+
+def bench_extraction(app_module, sizes, repeats, rng):
+    """extract_symptoms_from_text throughput on synthetic texts"""
+    state = app_module.current_model
+    results = {}
+
+    for size in sizes:
+        text = synthetic_text(state.symptoms, size, rng)
+        best = float('inf')
+        for _ in range(repeats):
+            start = time.perf_counter()
+            app_module.extract_symptoms_from_text(text, state)
+            best = min(best, time.perf_counter() - start)
+        label = f'{size // 1000}k'
+        results[f'extract.{label}.ms'] = metric(best * 1000, 'ms', 'lower')
+        results[f'extract.{label}.mb_per_s'] = metric(len(text) / best / 1e6, 'MB/s', 'higher')
+
+    return results
+
+
+def page_image(symptoms, rng, lines=40):
+    """White page with printed report lines, like a rendered PDF page"""
+    from PIL import Image, ImageDraw, ImageFont
+
+    try:
+        font = ImageFont.load_default(size=28)
+    except TypeError:
+        font = ImageFont.load_default()
+
+    image = Image.new('RGB', (1654, 2339), 'white')
+    draw = ImageDraw.Draw(image)
+    for line in range(lines):
+        text = synthetic_text(symptoms, 70, rng)
+        draw.text((100, 100 + line * 52), text, fill='black', font=font)
+    return image
+
+
+def bench_ocr(app_module, pages, rng):
+    """OCR cascade seconds per generated page"""
+    import ocr
+
+    if shutil.which('tesseract') is None:
+        return {}, 'tesseract not installed'
+
+    state = app_module.current_model
+    images = [page_image(state.symptoms, rng) for _ in range(pages)]
+    seconds = []
+    for image in images:
+        start = time.perf_counter()
+        ocr.run_ocr_cascade(image)
+        seconds.append(time.perf_counter() - start)
+
+    return {
+        'ocr.page.mean_s': metric(np.mean(seconds), 's', 'lower'),
+        'ocr.page.max_s': metric(np.max(seconds), 's', 'lower'),
+    }, None
+
+
+def compare(results, baseline, threshold):
+    """Return rows of (name, baseline, current, relative change, regressed)"""
+    rows = []
+    for name, current in sorted(results.items()):
+        previous = baseline.get(name)
+        if previous is None or previous['value'] == 0:
+            continue
+        change = (current['value'] - previous['value']) / previous['value']
+        worse = -change if current['better'] == 'higher' else change
+        rows.append((name, previous['value'], current['value'], change, worse > threshold))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark prediction, symptom extraction and OCR')
+    parser.add_argument('--output', default='benchmark_results.json', help='where to write the results')
+    parser.add_argument('--baseline', help='earlier results to compare against')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='relative slowdown counted as a regression (default 0.10)')
+    parser.add_argument('--quick', action='store_true', help='fewer iterations, for a smoke run')
+    parser.add_argument('--skip', nargs='*', default=[], choices=['predict', 'batch', 'extract', 'ocr'])
+    args = parser.parse_args()
+
+    requests_per_level = 200 if args.quick else 2000
+    synthetic_rows = 2000 if args.quick else 20000
+    repeats = 2 if args.quick else 5
+    text_sizes = [10_000, 100_000] if args.quick else [10_000, 100_000, 1_000_000]
+    ocr_pages = 1 if args.quick else 5
+
+    import app as app_module
+
+    results = {}
+    skipped = {}
+    if 'predict' not in args.skip:
+        print("Benchmarking /predict...")
+        results.update(bench_predict(app_module, requests_per_level, np.random.default_rng(SEED)))
+    if 'batch' not in args.skip:
+        print("Benchmarking batch scoring...")
+        results.update(bench_batch(app_module, synthetic_rows, repeats, np.random.default_rng(SEED)))
+    if 'extract' not in args.skip:
+        print("Benchmarking symptom extraction...")
+        results.update(bench_extraction(app_module, text_sizes, repeats, np.random.default_rng(SEED)))
+    if 'ocr' not in args.skip:
+        print("Benchmarking OCR...")
+        ocr_results, reason = bench_ocr(app_module, ocr_pages, np.random.default_rng(SEED))
+        results.update(ocr_results)
+        if reason:
+            skipped['ocr'] = reason
+
+    report = {
+        'meta': {
+            'created_at': time.time(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'model_checksum': app_module.current_model.checksum,
+            'quick': args.quick,
+            'skipped': skipped
+        },
+        'results': results
+    }
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(f"\nResults written to {args.output}")
+
+    for name, value in sorted(results.items()):
+        print(f"  {name:<36} {value['value']:>14.3f} {value['unit']}")
+    for name, reason in skipped.items():
+        print(f"  {name:<36} skipped ({reason})")
+
+    if not args.baseline:
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)['results']
+
+    rows = compare(results, baseline, args.threshold)
+    print(f"\nComparison with {args.baseline} (regression threshold {args.threshold:.0%}):")
+    for name, previous, current, change, regressed in rows:
+        flag = 'REGRESSION' if regressed else ''
+        print(f"  {name:<36} {previous:>12.3f} -> {current:>12.3f}  {change:+7.1%}  {flag}")
+
+    regressions = [row[0] for row in rows if row[4]]
+    if regressions:
+        print(f"\n{len(regressions)} metric(s) regressed: {', '.join(regressions)}")
+        return 1
+    print("\nNo regressions.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
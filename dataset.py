@@ -0,0 +1,189 @@
+"""
+Compact loader for the symptom datasets (Training.csv, Testing.csv).
+
+The CSVs are wide tables of 0/1 symptom flags plus a "prognosis" column.
+Features are read in chunks straight into a uint8 matrix (1 byte per flag
+instead of pandas' 8), and stray columns such as "Unnamed: 133" are dropped.
+
+The parsed arrays are cached as .npy sidecars in DATASET_CACHE_DIR, keyed by
+the SHA-256 of the CSV. Later loads of an unchanged file memory-map the
+sidecar instead of parsing the CSV again.
+"""
+
+import csv
+import glob
+import hashlib
+import json
+import os
+import tempfile
+from collections import namedtuple
+import numpy as np
+
+DATASET_CACHE_DIR = '.dataset_cache'
+CHUNK_ROWS = 50000  # CSV rows parsed at a time
+LABEL_COLUMN = 'prognosis'
+
+Dataset = namedtuple('Dataset', ['features', 'labels', 'symptoms', 'source_hash'])
+
+
+def file_stats(path, block_size=1 << 20):
+    """Return (sha256 hex digest, number of lines) in one streaming pass"""
+    digest = hashlib.sha256()
+    lines = 0
+    last = b'\n'
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+            lines += block.count(b'\n')
+            last = block[-1:]
+    if last != b'\n':
+        lines += 1
+    return digest.hexdigest(), lines
+
+
+def read_columns(path):
+    """Symptom columns of a dataset CSV, without the label and unnamed columns
+
+    Repeated names get pandas' suffixes (Training.csv has fluid_overload
+    twice; the second is "fluid_overload.1" in symptom_names.pkl).
+    """
+    with open(path, newline='') as f:
+        header = next(csv.reader(f))
+
+    columns = []
+    seen = set()
+    for name in header:
+        unique = name
+        suffix = 0
+        while unique in seen:
+            suffix += 1
+            unique = f"{name}.{suffix}"
+        seen.add(unique)
+        columns.append(unique)
+
+    return [name for name in columns
+            if name != LABEL_COLUMN and name.strip() and not name.startswith('Unnamed:')]
+
+
+def _sidecar_paths(path, source_hash):
+    stem = os.path.join(DATASET_CACHE_DIR, f"{os.path.basename(path)}-{source_hash[:16]}")
+    return stem + '.features.npy', stem + '.labels.npy', stem + '.json'
+
+
+def _load_sidecar(path, source_hash):
+    features_path, labels_path, meta_path = _sidecar_paths(path, source_hash)
+    try:
+        # The metadata file is written last, so it marks a complete sidecar
+        with open(meta_path) as f:
+            meta = json.load(f)
+        features = np.load(features_path, mmap_mode='r')
+        labels = np.load(labels_path)
+    except (OSError, ValueError):
+        return None
+
+    if meta.get('source_hash') != source_hash or features.shape != (len(labels), len(meta['symptoms'])):
+        return None
+    return Dataset(features, labels, meta['symptoms'], source_hash)
+
+
+def _parse_csv(path, symptoms, rows, features_out):
+    """Fill features_out chunk by chunk and return (labels, rows parsed)"""
+    import pandas as pd
+
+    dtypes = {name: np.uint8 for name in symptoms}
+    dtypes[LABEL_COLUMN] = str
+
+    labels = []
+    filled = 0
+    chunks = pd.read_csv(path, usecols=symptoms + [LABEL_COLUMN], dtype=dtypes, chunksize=CHUNK_ROWS)
+    for chunk in chunks:
+        n = len(chunk)
+        if filled + n > rows:
+            raise ValueError(f"{path} changed while it was being read")
+        features_out[filled:filled + n] = chunk[symptoms].to_numpy(dtype=np.uint8)
+        labels.extend(chunk[LABEL_COLUMN].tolist())
+        filled += n
+    return np.array(labels, dtype=str), filled
+
+
+def load_dataset(path, cache=True):
+    """Load a dataset CSV as uint8 features, string labels and symptom names
+
+    With cache=True the result is read from (or written to) the .npy
+    sidecar for this exact file content, and features are memory-mapped.
+    """
+    source_hash, lines = file_stats(path)
+    if cache:
+        cached = _load_sidecar(path, source_hash)
+        if cached is not None:
+            return cached
+
+    symptoms = read_columns(path)
+    rows = max(lines - 1, 0)  # upper bound: blank lines are skipped by the parser
+
+    if not cache:
+        features = np.zeros((rows, len(symptoms)), dtype=np.uint8)
+        labels, filled = _parse_csv(path, symptoms, rows, features)
+        return Dataset(features[:filled], labels, symptoms, source_hash)
+
+    # Parse straight into a temporary .npy so peak memory stays at one chunk
+    os.makedirs(DATASET_CACHE_DIR, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=DATASET_CACHE_DIR, prefix='.features-', suffix='.npy')
+    os.close(fd)
+    try:
+        features = np.lib.format.open_memmap(temp_path, mode='w+', dtype=np.uint8, shape=(rows, len(symptoms)))
+        labels, filled = _parse_csv(path, symptoms, rows, features)
+        if filled != rows:
+            trimmed = np.array(features[:filled])
+            del features
+            np.save(temp_path, trimmed)
+        else:
+            features.flush()
+            del features
+        _write_sidecar(path, source_hash, temp_path, labels, symptoms)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    return _load_sidecar(path, source_hash)
+
+
+def _write_sidecar(path, source_hash, features_temp_path, labels, symptoms):
+    """Move parsed arrays into place and drop sidecars of older versions of the file"""
+    features_path, labels_path, meta_path = _sidecar_paths(path, source_hash)
+    current = {features_path, labels_path, meta_path}
+
+    for stale in glob.glob(os.path.join(DATASET_CACHE_DIR, f"{glob.escape(os.path.basename(path))}-*")):
+        if stale not in current:
+            os.remove(stale)
+
+    os.replace(features_temp_path, features_path)
+
+    fd, temp_path = tempfile.mkstemp(dir=DATASET_CACHE_DIR, prefix='.labels-', suffix='.npy')
+    with os.fdopen(fd, 'wb') as f:
+        np.save(f, labels)
+    os.replace(temp_path, labels_path)
+
+    fd, temp_path = tempfile.mkstemp(dir=DATASET_CACHE_DIR, prefix='.meta-')
+    with os.fdopen(fd, 'w') as f:
+        json.dump({'source': os.path.basename(path), 'source_hash': source_hash, 'symptoms': symptoms}, f)
+    os.replace(temp_path, meta_path)
+
+
+def concat_datasets(base, other):
+    """Append other's rows to base, reordering other's columns to base's symptoms"""
+    if list(other.symptoms) != list(base.symptoms):
+        columns = {name: i for i, name in enumerate(other.symptoms)}
+        missing = [name for name in base.symptoms if name not in columns]
+        if missing:
+            raise ValueError(f"Dataset is missing symptom columns: {missing[:5]}")
+        other_features = np.asarray(other.features)[:, [columns[name] for name in base.symptoms]]
+    else:
+        other_features = other.features
+
+    return Dataset(
+        np.concatenate([base.features, other_features]),
+        np.concatenate([base.labels, other.labels]),
+        list(base.symptoms),
+        None
+    )
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Model diagnostics over large samples of the symptom space.
+
+Scores hundreds of thousands of generated symptom sets with the model
+bundle and reports, per disease:
+  - how often it is predicted, against an even share of the classes
+  - the confidence distribution of those predictions (mean and quantiles)
+  - the symptoms most responsible for it: the highest lift, meaning how much
+    more common the symptom is in sets predicted as the disease than overall
+
+Two kinds of sets are generated:
+  - random: 1-6 symptoms drawn uniformly (the tuberculosis-bias check)
+  - stratified: the same number of sets per disease, each a training row of
+    that disease with some symptoms dropped and a few unrelated ones added.
+    This also reports how often the source disease is still recovered
+
+Sets are generated and scored in fixed-size chunks on a process pool, each
+worker memory-mapping the same bundle. Only per-chunk aggregates come back,
+so memory stays flat however many sets are scored. Every chunk has its own
+seed, so results don't depend on the number of workers.
+
+    python diagnostics.py --samples 300000
+    python diagnostics.py --mode stratified --max-share-ratio 3   # exit 1 if a class is over-predicted
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import training
+from model_bundle import load_bundle
+
+BUNDLE_PATH = 'disease_model.bundle'
+SAMPLES = 200000
+CHUNK_ROWS = 16384  # sets generated and scored per task
+SEED = 67
+MIN_SET_SIZE = 1
+MAX_SET_SIZE = 6
+KEEP_PROBABILITY = 0.6  # stratified: chance each of the row's symptoms is kept
+NOISE_SYMPTOMS = 1.0  # stratified: unrelated symptoms added per set, on average
+CONFIDENCE_BINS = 100
+TOP_SYMPTOMS = 5
+MIN_SUPPORT = 20  # predictions a symptom must appear in to be ranked for a class
+
+# Per-worker state, loaded once per process
+_bundle = None
+_training = None
+
+
+def _worker_bundle(bundle_path):
+    global _bundle
+    if _bundle is None:
+        _bundle = load_bundle(bundle_path, verify=False)
+    return _bundle
+
+
+def _worker_training(symptoms, class_columns):
+    """Training rows and their class column, reordered to the bundle's symptoms"""
+    global _training
+    if _training is None:
+        data = training.load_training_data()
+        index = {name: i for i, name in enumerate(data.symptoms)}
+        features = np.asarray(data.features)[:, [index[name] for name in symptoms]]
+        columns = np.array([class_columns.get(label, -1) for label in data.labels])
+        _training = features, columns
+    return _training
+
+
+def class_columns(bundle):
+    """Disease name -> output column of the forest"""
+    return {str(bundle.class_names[c]): column for column, c in enumerate(bundle.forest.classes)}
+
+
+def random_sets(rng, rows, n_symptoms, min_size=MIN_SET_SIZE, max_size=MAX_SET_SIZE):
+    """uint8 matrix of sets with a uniform size and uniformly drawn symptoms"""
+    sizes = rng.integers(min_size, max_size + 1, size=rows)
+    order = np.argsort(rng.random((rows, n_symptoms)), axis=1)
+    chosen = np.arange(n_symptoms) < sizes[:, None]
+    features = np.zeros((rows, n_symptoms), dtype=np.uint8)
+    features[np.nonzero(chosen)[0], order[chosen]] = 1
+    return features
+
+
+def stratified_sets(rng, rows, features, columns, n_classes):
+    """Sets drawn evenly per class from perturbed training rows; returns (sets, source columns)"""
+    # Training rows grouped by class, so row k of class c is order[starts[c] + k]
+    labelled = np.flatnonzero(columns >= 0)
+    order = labelled[np.argsort(columns[labelled], kind='stable')]
+    counts = np.bincount(columns[labelled], minlength=n_classes)
+    starts = np.cumsum(counts) - counts
+
+    source = rng.choice(np.flatnonzero(counts), size=rows)
+    picked = order[starts[source] + (rng.random(rows) * counts[source]).astype(np.intp)]
+
+    base = features[picked]
+    n_symptoms = base.shape[1]
+    kept = base & (rng.random(base.shape) < KEEP_PROBABILITY)
+    noise = rng.random(base.shape) < NOISE_SYMPTOMS / n_symptoms
+    sets = (kept | noise).astype(np.uint8)
+
+    # A set must have at least one symptom, like a request
+    empty = ~sets.any(axis=1)
+    sets[empty] = base[empty]
+    return sets, source
+
+
+def score_chunk(bundle_path, mode, seed, rows, min_size, max_size):
+    """Generate and score one chunk; returns its aggregates"""
+    bundle = _worker_bundle(bundle_path)
+    forest = bundle.forest
+    n_classes = forest.n_classes
+    n_symptoms = len(bundle.symptoms)
+    rng = np.random.default_rng(seed)
+
+    if mode == 'random':
+        sets = random_sets(rng, rows, n_symptoms, min_size, max_size)
+        source = None
+    else:
+        features, columns = _worker_training(bundle.symptoms, class_columns(bundle))
+        sets, source = stratified_sets(rng, rows, features, columns, n_classes)
+
+    probabilities = forest.predict_proba(sets)
+    predicted = probabilities.argmax(axis=1)
+    confidence = probabilities[np.arange(len(predicted)), predicted]
+    bins = np.minimum((confidence * CONFIDENCE_BINS).astype(np.intp), CONFIDENCE_BINS - 1)
+
+    # Symptom counts per predicted class: one-hot(predicted).T @ sets
+    one_hot = np.zeros((len(predicted), n_classes), dtype=np.float32)
+    one_hot[np.arange(len(predicted)), predicted] = 1
+
+    aggregates = {
+        'rows': len(predicted),
+        'predicted': np.bincount(predicted, minlength=n_classes),
+        'confidence_sum': np.bincount(predicted, weights=confidence, minlength=n_classes),
+        'confidence_hist': np.bincount(predicted * CONFIDENCE_BINS + bins, minlength=n_classes * CONFIDENCE_BINS)
+                             .reshape(n_classes, CONFIDENCE_BINS),
+        'symptoms_by_class': (one_hot.T @ sets.astype(np.float32)).astype(np.int64),
+        'symptoms': sets.sum(axis=0, dtype=np.int64),
+        'set_sizes': np.bincount(sets.sum(axis=1, dtype=np.intp), minlength=n_symptoms + 1),
+    }
+    if source is not None:
+        aggregates['sources'] = np.bincount(source, minlength=n_classes)
+        aggregates['recovered'] = np.bincount(source[predicted == source], minlength=n_classes)
+    return aggregates
+
+
+def merge(total, part):
+    if total is None:
+        return part
+    return {key: total[key] + part[key] for key in total}
+
+
+def histogram_quantile(hist, q):
+    """Approximate quantile (upper bin edge) of a confidence histogram"""
+    total = hist.sum()
+    if not total:
+        return None
+    index = int(np.searchsorted(np.cumsum(hist), q * total))
+    return (index + 1) / CONFIDENCE_BINS
+
+
+def run_diagnostics(bundle_path=BUNDLE_PATH, samples=SAMPLES, mode='random', seed=SEED, workers=None,
+                    min_size=MIN_SET_SIZE, max_size=MAX_SET_SIZE, chunk_rows=CHUNK_ROWS):
+    """Score samples generated sets and return the report as a dict"""
+    bundle = load_bundle(bundle_path)
+    names = [str(bundle.class_names[c]) for c in bundle.forest.classes]
+    symptoms = list(bundle.symptoms)
+
+    sizes = [chunk_rows] * (samples // chunk_rows) + ([samples % chunk_rows] if samples % chunk_rows else [])
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    started = time.perf_counter()
+
+    totals = None
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures = [
+            pool.submit(score_chunk, bundle_path, mode, chunk_seed, rows, min_size, max_size)
+            for chunk_seed, rows in zip(seeds, sizes)
+        ]
+        for future in futures:
+            totals = merge(totals, future.result())
+    seconds = time.perf_counter() - started
+
+    rows = totals['rows']
+    even_share = 1 / len(names)
+    overall_frequency = totals['symptoms'] / rows
+    classes = {}
+
+    for column, name in enumerate(names):
+        count = int(totals['predicted'][column])
+        hist = totals['confidence_hist'][column]
+        entry = {
+            'predicted': count,
+            'share': round(count / rows, 6),
+            'share_ratio': round(count / rows / even_share, 4),
+            'mean_confidence': round(float(totals['confidence_sum'][column]) / count, 4) if count else None,
+            'confidence_p10': histogram_quantile(hist, 0.1),
+            'confidence_p50': histogram_quantile(hist, 0.5),
+            'confidence_p90': histogram_quantile(hist, 0.9),
+            'top_symptoms': []
+        }
+
+        # Lift of each symptom among the sets predicted as this class
+        if count:
+            in_class = totals['symptoms_by_class'][column]
+            lift = np.divide(in_class / count, overall_frequency, out=np.zeros(len(symptoms)), where=overall_frequency > 0)
+            lift[in_class < MIN_SUPPORT] = 0
+            for i in np.argsort(-lift, kind='stable')[:TOP_SYMPTOMS]:
+                if lift[i] > 0:
+                    entry['top_symptoms'].append({'symptom': symptoms[i], 'lift': round(float(lift[i]), 3)})
+
+        if 'sources' in totals:
+            sources = int(totals['sources'][column])
+            entry['recovery_rate'] = round(int(totals['recovered'][column]) / sources, 4) if sources else None
+        classes[name] = entry
+
+    confidence_hist = totals['confidence_hist'].sum(axis=0)
+    report = {
+        'bundle': os.path.abspath(bundle_path),
+        'checksum': bundle.checksum,
+        'mode': mode,
+        'samples': rows,
+        'seed': seed,
+        'seconds': round(seconds, 3),
+        'sets_per_second': round(rows / seconds, 1),
+        'set_sizes': {str(size): int(n) for size, n in enumerate(totals['set_sizes']) if n},
+        'confidence': {
+            'mean': round(float(totals['confidence_sum'].sum()) / rows, 4),
+            'p10': histogram_quantile(confidence_hist, 0.1),
+            'p50': histogram_quantile(confidence_hist, 0.5),
+            'p90': histogram_quantile(confidence_hist, 0.9),
+            'histogram': confidence_hist.tolist()
+        },
+        'classes': classes
+    }
+    if 'sources' in totals:
+        report['recovery_rate'] = round(int(totals['recovered'].sum()) / rows, 4)
+    return report
+
+
+def print_report(report, top=None):
+    """Human-readable summary, most predicted classes first"""
+    print(f"{report['samples']} {report['mode']} sets scored in {report['seconds']}s "
+          f"({report['sets_per_second']:.0f} sets/s)")
+    confidence = report['confidence']
+    print(f"Confidence: mean {confidence['mean']:.3f}, p10 {confidence['p10']:.2f}, "
+          f"p50 {confidence['p50']:.2f}, p90 {confidence['p90']:.2f}")
+    if 'recovery_rate' in report:
+        print(f"Source disease recovered: {report['recovery_rate'] * 100:.1f}%")
+
+    ranked = sorted(report['classes'].items(), key=lambda item: -item[1]['predicted'])
+    print(f"\n{'disease':<42} {'share':>7} {'x even':>7} {'conf':>6} {'p10-p90':>10}  top symptoms (lift)")
+    for name, entry in ranked[:top]:
+        quantiles = f"{entry['confidence_p10'] or 0:.2f}-{entry['confidence_p90'] or 0:.2f}"
+        symptoms = ', '.join(f"{s['symptom']} ({s['lift']:.1f})" for s in entry['top_symptoms'][:3])
+        print(f"{name[:42]:<42} {entry['share'] * 100:>6.2f}% {entry['share_ratio']:>7.2f} "
+              f"{entry['mean_confidence'] or 0:>6.3f} {quantiles:>10}  {symptoms}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bundle', default=BUNDLE_PATH)
+    parser.add_argument('--samples', type=int, default=SAMPLES)
+    parser.add_argument('--mode', choices=['random', 'stratified'], default='random')
+    parser.add_argument('--min-size', type=int, default=MIN_SET_SIZE, help='random mode: fewest symptoms per set')
+    parser.add_argument('--max-size', type=int, default=MAX_SET_SIZE, help='random mode: most symptoms per set')
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--workers', type=int, help='worker processes (default: one per CPU)')
+    parser.add_argument('--output', help='also write the full report as JSON')
+    parser.add_argument('--max-share-ratio', type=float,
+                        help='exit with status 1 if a disease is predicted more than this many times its even share')
+    args = parser.parse_args()
+
+    report = run_diagnostics(args.bundle, args.samples, args.mode, args.seed, args.workers, args.min_size, args.max_size)
+    print_report(report)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
+
+    if args.max_share_ratio is not None:
+        over = [name for name, entry in report['classes'].items() if entry['share_ratio'] > args.max_share_ratio]
+        if over:
+            print(f"\nOver-predicted (more than {args.max_share_ratio:g}x even share): {', '.join(over)}")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,286 @@
+"""
+NumPy-only inference engine for the disease RandomForestClassifier.
+
+The fitted sklearn forest is exported once into flat, contiguous node arrays
+(feature, threshold, left, right, leaf values). Prediction never imports
+sklearn.
+
+Symptom rows are 0/1, so every split in a tree sends a row the same way for
+a given feature value. Each tree's leaves are numbered left to right, and
+for every (feature, tree) pair a bitset holds the leaves still reachable when
+that feature is 1: the AND of the masks of all its nodes that then go right,
+each clearing the leaves of that node's left subtree. A row's leaf in a tree
+is the lowest bit left after ANDing the bitsets of its present symptoms
+(QuickScorer-style evaluation), so the work is a few integer ANDs per present
+symptom and tree instead of one gather per tree level. Rows with other values
+are walked through all trees together, one tree level per step. Either way
+the leaf distributions are summed in estimator order, so the probabilities
+match sklearn exactly.
+"""
+
+import numpy as np
+
+# Rows scored per step; keeps the (row, tree) working set small and cache resident
+CHUNK_ROWS = 256
+# Forests whose leaf bitset tables would be larger than this use the level walk only
+MAX_BITSET_BYTES = 64 * 1024 * 1024
+
+
+def _as_matrix(X):
+    """Convert input rows to the float32 matrix layout sklearn trees compare against"""
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    if X.ndim == 1:
+        X = X.reshape(1, -1)
+    return X
+
+
+class FlatForest:
+    """All trees of a fitted forest stored as flat node arrays"""
+
+    def __init__(self, feature, threshold, left, right, value, roots, max_depth, classes):
+        self.feature = feature        # split feature per node (0 for leaves)
+        self.threshold = threshold    # split threshold per node (go left if x <= threshold)
+        self.left = left              # left child per node (leaves point to themselves)
+        self.right = right            # right child per node (leaves point to themselves)
+        self.value = value            # normalized class distribution per node
+        self.roots = roots            # root node of every tree
+        self.max_depth = int(max_depth)
+        self.classes = classes        # model.classes_
+        self.is_leaf = left == np.arange(len(left))
+        self._bitsets = None  # LeafBitsets, built by prepare() or on the first prediction
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def n_classes(self):
+        return self.value.shape[1]
+
+    @property
+    def n_nodes(self):
+        return len(self.feature)
+
+    def arrays(self):
+        """Return the flat arrays that fully describe the forest"""
+        return {
+            'feature': self.feature,
+            'threshold': self.threshold,
+            'left': self.left,
+            'right': self.right,
+            'value': self.value,
+            'roots': self.roots,
+            'classes': self.classes,
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays, max_depth):
+        """Rebuild a forest from the output of arrays()"""
+        return cls(
+            arrays['feature'], arrays['threshold'], arrays['left'], arrays['right'],
+            arrays['value'], arrays['roots'], max_depth, arrays['classes']
+        )
+
+    def apply(self, X):
+        """Return the leaf reached in every tree, shape (n_samples, n_trees)"""
+        return self._leaves(_as_matrix(X)).T
+
+    def prepare(self):
+        """Build the leaf bitset tables now rather than on the first prediction"""
+        self._leaf_bitsets()
+        return self
+
+    def _leaf_bitsets(self):
+        if self._bitsets is None:
+            self._bitsets = _build_leaf_bitsets(self) or False  # False: too large, walk instead
+        return self._bitsets
+
+    def _leaves(self, X):
+        """Leaf reached in every tree, shape (n_trees, n_samples)"""
+        bitsets = self._leaf_bitsets() if _is_binary(X) else False
+        leaves = np.empty((self.n_trees, X.shape[0]), dtype=np.intp)
+        for start in range(0, X.shape[0], CHUNK_ROWS):
+            chunk = X[start:start + CHUNK_ROWS]
+            leaves[:, start:start + CHUNK_ROWS] = bitsets.leaves(chunk) if bitsets else self._apply_chunk(chunk).T
+        return leaves
+
+    def _apply_chunk(self, X):
+        n_samples, n_features = X.shape
+        nodes = np.tile(self.roots, n_samples)
+        flat_X = X.ravel()
+        row_offsets = np.repeat(np.arange(n_samples) * n_features, self.n_trees)
+
+        # Descend one level per step, only for (row, tree) pairs not yet at a leaf
+        active = np.flatnonzero(~self.is_leaf[nodes])
+        while active.size:
+            current = nodes[active]
+            go_left = flat_X[row_offsets[active] + self.feature[current]] <= self.threshold[current]
+            children = np.where(go_left, self.left[current], self.right[current])
+            nodes[active] = children
+            active = active[~self.is_leaf[children]]
+
+        return nodes.reshape(n_samples, self.n_trees)
+
+    def predict_proba(self, X):
+        """Class probabilities, identical to RandomForestClassifier.predict_proba"""
+        X = _as_matrix(X)
+        leaves = self._leaves(X)
+
+        # Add trees one at a time in estimator order, like sklearn does
+        proba = np.zeros((X.shape[0], self.n_classes), dtype=np.float64)
+        for tree_leaves in leaves:
+            proba += self.value[tree_leaves]
+
+        proba /= self.n_trees
+        return proba
+
+    def predict(self, X):
+        """Predicted classes, identical to RandomForestClassifier.predict"""
+        return self.classes.take(self.predict_proba(X).argmax(axis=1))
+
+
+def _leaf_values_are_normalized():
+    """sklearn >= 1.4 stores class fractions in tree_.value instead of counts"""
+    from sklearn import __version__
+
+    major, minor = (int(part) for part in __version__.split('.')[:2])
+    return (major, minor) >= (1, 4)
+
+
+def _is_binary(X):
+    """True if every value is 0 or 1, as in symptom rows"""
+    return bool(((X == 0) | (X == 1)).all())
+
+
+class LeafBitsets:
+    """Per (feature, tree) bitsets of the leaves a 0/1 row can still reach"""
+
+    def __init__(self, present, base, leaf_nodes):
+        self.present = present          # (n_features, n_trees, words): reachable leaves if the feature is 1
+        self.base = base                # (n_trees, words): reachable leaves when every feature is 0
+        self.leaf_nodes = leaf_nodes    # (n_trees, words * 64): node id of each leaf, left to right
+        self.tree_ids = np.arange(base.shape[0])[:, np.newaxis]
+
+    def leaves(self, X):
+        """Leaf reached in every tree, shape (n_trees, n_samples); X must be 0/1"""
+        n_trees, words = self.base.shape
+        reachable = np.broadcast_to(self.base, (X.shape[0], n_trees, words)).copy()
+
+        # AND the bitsets of each row's present features (rows come out of nonzero() in order);
+        # columns past the last split feature don't change any path
+        rows, features = np.nonzero(X)
+        used = features < len(self.present)
+        rows, features = rows[used], features[used]
+        if rows.size:
+            starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+            reachable[rows[starts]] = np.bitwise_and.reduceat(self.present[features], starts, axis=0)
+
+        # The exit leaf is the lowest set bit
+        word = (reachable != 0).argmax(axis=2)
+        bits = np.take_along_axis(reachable, word[..., np.newaxis], axis=2)[..., 0]
+        lowest = bits & (~bits + np.uint64(1))
+        rank = word * 64 + np.frexp(lowest.astype(np.float64))[1] - 1
+        return self.leaf_nodes[self.tree_ids, rank.T]
+
+
+def _build_leaf_bitsets(forest):
+    """LeafBitsets for the forest, or None if the tables would exceed MAX_BITSET_BYTES"""
+    n_trees, n_nodes = forest.n_trees, forest.n_nodes
+    is_leaf, lefts, rights = forest.is_leaf.tolist(), forest.left.tolist(), forest.right.tolist()
+
+    # Left-to-right leaf order per tree, and the leaf range [first, stop) under every node
+    first = [0] * n_nodes
+    stop = [0] * n_nodes
+    leaf_orders = []
+    for root in forest.roots.tolist():
+        order = []
+        stack = [(root, False)]
+        while stack:
+            node, children_done = stack.pop()
+            if is_leaf[node]:
+                first[node], stop[node] = len(order), len(order) + 1
+                order.append(node)
+            elif children_done:
+                first[node], stop[node] = first[lefts[node]], stop[rights[node]]
+            else:
+                stack += [(node, True), (rights[node], False), (lefts[node], False)]
+        leaf_orders.append(order)
+    first, stop = np.array(first), np.array(stop)
+
+    words = (max(map(len, leaf_orders)) + 63) // 64
+    n_features = int(forest.feature.max()) + 1
+    if n_features * n_trees * words * 8 > MAX_BITSET_BYTES:
+        return None
+
+    # Going right at a node makes every leaf of its left subtree unreachable
+    internal = np.flatnonzero(~forest.is_leaf)
+    left = forest.left[internal]
+    bit = np.arange(words * 64)
+    keep = (bit < first[left][:, np.newaxis]) | (bit >= stop[left][:, np.newaxis])
+    masks = np.packbits(keep.reshape(-1, words, 64), axis=2, bitorder='little').view(np.uint64).reshape(-1, words)
+
+    # A node goes right for x = 1 if threshold < 1, and for x = 0 if threshold < 0
+    tree = np.repeat(np.arange(n_trees), np.diff(np.append(forest.roots, n_nodes)))[internal]
+    feature = forest.feature[internal]
+    threshold = forest.threshold[internal]
+    present = np.full((n_features, n_trees, words), ~np.uint64(0))
+    absent = np.full((n_features, n_trees, words), ~np.uint64(0))
+    for goes_right, table in ((threshold < 1, present), (threshold < 0, absent)):
+        np.bitwise_and.at(table, (feature[goes_right], tree[goes_right]), masks[goes_right])
+    base = np.bitwise_and.reduce(absent, axis=0)
+
+    # Fold in the other features being 0, so a row only ANDs the bitsets of its present features
+    present &= base
+
+    leaf_nodes = np.zeros((n_trees, words * 64), dtype=np.intp)
+    for tree_id, order in enumerate(leaf_orders):
+        leaf_nodes[tree_id, :len(order)] = order
+    return LeafBitsets(present, base, leaf_nodes)
+
+
+def export_forest(model):
+    """Flatten a fitted RandomForestClassifier into a FlatForest"""
+    n_classes = len(model.classes_)
+    normalized = _leaf_values_are_normalized()
+
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    max_depth = 0
+    offset = 0
+
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        node_ids = np.arange(tree.node_count)
+        leaf = tree.children_left == -1
+
+        # Leaves point to themselves, so a finished path stays where it is
+        left = np.where(leaf, node_ids, tree.children_left) + offset
+        right = np.where(leaf, node_ids, tree.children_right) + offset
+
+        # Per-leaf probabilities computed exactly as DecisionTreeClassifier.predict_proba
+        value = np.array(tree.value[:, 0, :n_classes], dtype=np.float64)
+        if not normalized:
+            normalizer = value.sum(axis=1)[:, np.newaxis]
+            normalizer[normalizer == 0.0] = 1.0
+            value /= normalizer
+
+        features.append(np.where(leaf, 0, tree.feature))
+        thresholds.append(np.where(leaf, np.inf, tree.threshold))
+        lefts.append(left)
+        rights.append(right)
+        values.append(value)
+        roots.append(offset)
+
+        max_depth = max(max_depth, tree.max_depth)
+        offset += tree.node_count
+
+    # Index arrays use the native index type so gathers need no conversion
+    return FlatForest(
+        feature=np.concatenate(features).astype(np.intp),
+        threshold=np.concatenate(thresholds).astype(np.float64),
+        left=np.concatenate(lefts).astype(np.intp),
+        right=np.concatenate(rights).astype(np.intp),
+        value=np.ascontiguousarray(np.concatenate(values)),
+        roots=np.array(roots, dtype=np.intp),
+        max_depth=max_depth,
+        classes=np.asarray(model.classes_),
+    )
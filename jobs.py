@@ -0,0 +1,233 @@
+"""
+In-process background job queue.
+
+Slow work (OCR of uploads) is submitted here and runs on a small bounded pool
+of worker threads, so request threads return immediately and cheap requests
+never wait behind it. Clients poll the job for status and partial results.
+
+The backend is pluggable: ThreadBackend is the default, InlineBackend runs
+jobs in the caller (handy for scripts and debugging). Nothing needs an
+external broker. When several worker processes serve the app, an optional
+store (e.g. caching.SQLiteCache on a shared file) receives a snapshot of
+every job change, so a poll can be answered by any process.
+"""
+
+import queue
+import threading
+import time
+import uuid
+from logs import get_logger
+
+logger = get_logger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class QueueFull(Exception):
+    """Raised when a job is submitted while the queue is at capacity"""
+
+
+class Job:
+    """A unit of background work and its progress"""
+
+    def __init__(self, func, args, kwargs):
+        self.id = uuid.uuid4().hex
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.status = QUEUED
+        self.progress = {}
+        self.partial = {}
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.on_change = None  # called with the job after every status or progress change
+        self._lock = threading.Lock()
+
+    def _changed(self):
+        if self.on_change is None:
+            return
+        try:
+            self.on_change(self)
+        except Exception:
+            # A failing store only hides the change from other processes; the job carries on
+            logger.exception("Could not publish job change", extra={'job_id': self.id, 'status': self.status})
+
+    def update(self, progress=None, partial=None):
+        """Report progress and partial results from inside the job"""
+        with self._lock:
+            if progress:
+                self.progress.update(progress)
+            if partial:
+                self.partial.update(partial)
+        self._changed()
+
+    def run(self):
+        self.status = RUNNING
+        self.started_at = time.time()
+        self._changed()
+        try:
+            self.result = self.func(self, *self.args, **self.kwargs)
+            self.status = DONE
+        except Exception as e:
+            self.error = str(e)
+            self.status = FAILED
+        finally:
+            self.finished_at = time.time()
+            self._changed()
+
+    @property
+    def finished(self):
+        return self.status in (DONE, FAILED)
+
+    def to_dict(self):
+        """JSON-ready view of the job"""
+        with self._lock:
+            data = {
+                'job_id': self.id,
+                'status': self.status,
+                'progress': dict(self.progress),
+                'partial': dict(self.partial),
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at
+            }
+        if self.status == DONE:
+            data['result'] = self.result
+        if self.status == FAILED:
+            data['error'] = self.error
+        return data
+
+
+class ThreadBackend:
+    """Runs jobs on a fixed number of daemon threads fed by a bounded queue"""
+
+    def __init__(self, workers=2, max_pending=16):
+        self.workers = workers
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def _start(self):
+        # Threads are started lazily so the module can be imported before forking
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f'job-worker-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            try:
+                job.run()
+            except Exception:
+                logger.exception("Job worker error", extra={'job_id': job.id})
+            finally:
+                self._queue.task_done()
+
+    def submit(self, job):
+        self._start()
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            raise QueueFull('Too many jobs queued, try again later')
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def wait(self, timeout=None):
+        """Wait until every submitted job has finished; False if timeout ran out first"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+
+class InlineBackend:
+    """Local stand-in that runs each job to completion in the submitting thread"""
+
+    def submit(self, job):
+        job.run()
+
+    def pending(self):
+        return 0
+
+    def wait(self, timeout=None):
+        return True
+
+
+class JobQueue:
+    """Tracks submitted jobs and hands them to a backend"""
+
+    def __init__(self, backend=None, ttl=3600, store=None):
+        self.backend = backend or ThreadBackend()
+        self.ttl = ttl  # seconds a finished job stays available for polling
+        self.store = store  # shared get/put/delete store of job snapshots, or None
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args, **kwargs):
+        """Queue func(job, *args, **kwargs) and return the Job; raises QueueFull"""
+        self._expire()
+        job = Job(func, args, kwargs)
+        if self.store is not None:
+            job.on_change = self._publish
+            job._changed()
+        with self._lock:
+            self._jobs[job.id] = job
+        try:
+            self.backend.submit(job)
+        except QueueFull:
+            with self._lock:
+                del self._jobs[job.id]
+            self._unpublish(job)
+            raise
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def status(self, job_id):
+        """JSON-ready view of a job from this process or, failing that, from the store"""
+        job = self.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        if self.store is not None:
+            return self.store.get(f'job:{job_id}')
+        return None
+
+    def wait(self, timeout=None):
+        """Wait for the backend to finish every submitted job"""
+        return self.backend.wait(timeout)
+
+    def _publish(self, job):
+        self.store.put(f'job:{job.id}', job.to_dict())
+
+    def _unpublish(self, job):
+        """Remove the snapshot of a job that was never queued"""
+        if self.store is None:
+            return
+        try:
+            self.store.delete(f'job:{job.id}')
+        except Exception:
+            logger.exception("Could not remove job snapshot", extra={'job_id': job.id})
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            for job_id in [job_id for job_id, job in self._jobs.items()
+                           if job.finished and job.finished_at < cutoff]:
+                del self._jobs[job_id]
@@ -0,0 +1,144 @@
+"""
+Single-file model artifact that can be memory-mapped.
+
+A bundle holds the flattened forest arrays (see forest_engine.py), the class
+names, the symptom names and a SHA-256 checksum of the array data. It may
+also hold extra arrays derived from the training data, such as the
+per-class symptom counts triage uses, so they always match the model.
+Layout:
+
+    8 bytes   magic b'DPMODEL\\0'
+    4 bytes   format version (little-endian uint32)
+    4 bytes   header length (little-endian uint32)
+    header    JSON: names, array dtypes/shapes/offsets, checksum
+    data      raw array buffers, each aligned to 64 bytes
+
+Loading maps the file read-only and wraps each buffer in a NumPy view, so
+nothing is copied and every process that loads the same file shares its
+pages through the OS page cache.
+"""
+
+import hashlib
+import json
+import os
+import struct
+import tempfile
+import time
+from collections import namedtuple
+import numpy as np
+from forest_engine import FlatForest
+
+MAGIC = b'DPMODEL\0'
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+
+ModelBundle = namedtuple('ModelBundle', ['forest', 'class_names', 'symptoms', 'checksum', 'created_at', 'extras'])
+
+
+class BundleError(Exception):
+    """Raised when a bundle file is missing, corrupt or of an unknown version"""
+
+
+def _aligned(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def write_bundle(path, forest, class_names, symptoms, extras=None):
+    """Write a bundle atomically (temp file in the same directory, then rename)
+
+    extras maps names to additional arrays stored next to the forest's.
+    """
+    extras = extras or {}
+    arrays = {name: np.ascontiguousarray(array) for name, array in forest.arrays().items()}
+    arrays.update((name, np.ascontiguousarray(array)) for name, array in extras.items())
+
+    # Lay the arrays out relative to the start of the data section
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        offset = _aligned(offset)
+        layout[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset, 'nbytes': array.nbytes}
+        offset += array.nbytes
+    data_size = offset
+
+    checksum = hashlib.sha256()
+    data = bytearray(data_size)
+    for name, array in arrays.items():
+        start = layout[name]['offset']
+        data[start:start + array.nbytes] = array.tobytes()
+    checksum.update(data)
+
+    header = json.dumps({
+        'format_version': FORMAT_VERSION,
+        'created_at': time.time(),
+        'max_depth': forest.max_depth,
+        'class_names': [str(name) for name in class_names],
+        'symptoms': list(symptoms),
+        'arrays': layout,
+        'extras': list(extras),
+        'data_size': data_size,
+        'sha256': checksum.hexdigest()
+    }).encode('utf-8')
+
+    prefix = MAGIC + struct.pack('<II', FORMAT_VERSION, len(header)) + header
+    padding = b'\0' * (_aligned(len(prefix)) - len(prefix))
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.bundle-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(prefix + padding)
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    return checksum.hexdigest()
+
+
+def read_header(path):
+    """Return (header dict, offset of the data section)"""
+    with open(path, 'rb') as f:
+        prefix = f.read(len(MAGIC) + 8)
+        if prefix[:len(MAGIC)] != MAGIC:
+            raise BundleError(f"{path} is not a model bundle")
+
+        version, header_length = struct.unpack('<II', prefix[len(MAGIC):])
+        if version != FORMAT_VERSION:
+            raise BundleError(f"Unsupported bundle version {version} (expected {FORMAT_VERSION})")
+
+        header = json.loads(f.read(header_length).decode('utf-8'))
+
+    return header, _aligned(len(prefix) + header_length)
+
+
+def load_bundle(path, verify=True):
+    """Memory-map a bundle and return a ModelBundle backed by the mapped pages"""
+    header, data_offset = read_header(path)
+    data = np.memmap(path, dtype=np.uint8, mode='r', offset=data_offset, shape=(header['data_size'],))
+
+    if verify and hashlib.sha256(data).hexdigest() != header['sha256']:
+        raise BundleError(f"Checksum mismatch in {path}")
+
+    arrays = {}
+    for name, spec in header['arrays'].items():
+        start = spec['offset']
+        array = data[start:start + spec['nbytes']].view(np.dtype(spec['dtype'])).reshape(spec['shape'])
+        # Index arrays must be native intp for the engine's gathers
+        if name in ('feature', 'left', 'right', 'roots') and array.dtype != np.intp:
+            array = array.astype(np.intp)
+        arrays[name] = array
+
+    return ModelBundle(
+        forest=FlatForest.from_arrays(arrays, header['max_depth']),
+        class_names=np.array(header['class_names']),
+        symptoms=header['symptoms'],
+        checksum=header['sha256'],
+        created_at=header['created_at'],
+        extras={name: arrays[name] for name in header.get('extras', [])}  # bundles from before extras have none
+    )
@@ -0,0 +1,420 @@
+"""
+OCR helpers: text extraction from images and PDFs.
+
+Images go through a cascade of OCR engines ordered by cost. The cascade stops
+as soon as one read is good enough (confident, or mentions enough symptoms),
+so clean scans only pay for the cheapest engine.
+
+PDF pages are rendered a few at a time and OCRed on a process pool, so large
+reports use every core while only a bounded number of rendered pages is held
+in memory. Pages are passed to the workers as in-memory images. The pool's
+workers are started by a fork server (spawned where there is none), never
+forked from the app, which by then runs threads and may hold torch.
+
+Pool workers only run the engines before the first one in
+IN_PROCESS_ENGINES (the Tesseract stages). A page they can't read well
+enough finishes the cascade in the app process, on its one EasyOCR reader,
+so EasyOCR/torch is never loaded per pool worker. Under serve.py that reader
+is loaded by the master before forking and shared by every worker.
+
+The heavy OCR stack (EasyOCR/torch, OpenCV, Tesseract, pdf2image) is only
+imported when first used, and the EasyOCR reader is loaded on a background
+warm-up thread, so importing this module is cheap.
+"""
+
+import hashlib
+import io
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import sys
+import numpy as np
+from PIL import Image
+import metrics
+from logs import get_logger
+
+logger = get_logger(__name__)
+
+# Configuration
+PDF_DPI = 200  # render resolution for PDF pages
+PDF_RENDER_BATCH = 4  # pages rendered per poppler call
+OCR_WORKERS = os.cpu_count() or 1  # processes used to OCR PDF pages
+PAGES_IN_FLIGHT = 2 * OCR_WORKERS  # max rendered pages waiting for OCR
+OCR_ENGINES = ['tesseract', 'otsu_tesseract', 'easyocr']  # cascade order, cheapest first
+IN_PROCESS_ENGINES = {'easyocr'}  # engines PDF pool workers leave to the app process's shared model
+OCR_MIN_CONFIDENCE = 80  # mean word confidence (0-100) that ends the cascade
+OCR_MIN_SYMPTOMS = 2  # symptoms found in the text that end the cascade
+
+# EasyOCR reader (one per process) and its loading state
+reader = None
+reader_status = 'not_loaded'  # 'loading', 'ready' or 'failed'
+reader_load_seconds = None
+_warmup_thread = None
+_reader_lock = threading.Lock()
+
+# Process pool for PDF pages, created on first use
+_pool = None
+_pool_symptoms = None  # symptom names the pool's workers were started with
+_pool_lock = threading.Lock()
+
+# Counts symptoms in a piece of text; set by use_symptoms() once the model is loaded
+symptom_counter = None
+_symptoms = ()
+
+# Cumulative per-engine timings for this process
+engine_stats = {}
+_stats_lock = threading.Lock()
+OCR_ENGINE_SECONDS = metrics.histogram('ocr_engine_duration_seconds', 'Time per OCR engine run', ['engine'])
+OCR_CASCADES = metrics.counter('ocr_cascades_total', 'Images read by the OCR cascade', ['stopped_early'])
+
+def init_reader():
+    """Initialize the EasyOCR reader"""
+    global reader, reader_status, reader_load_seconds
+
+    reader_status = 'loading'
+    start = time.perf_counter()
+    try:
+        import easyocr
+        reader = easyocr.Reader(['en'])
+        reader_status = 'ready'
+    except Exception as e:
+        logger.warning("EasyOCR initialization failed", extra={'error': str(e)})
+        reader = None
+        reader_status = 'failed'
+    reader_load_seconds = round(time.perf_counter() - start, 3)
+
+    return reader
+
+def start_warmup():
+    """Load the EasyOCR reader on a background thread"""
+    global _warmup_thread
+
+    # Pool workers (which re-import the main module when spawned) load it on demand instead
+    if multiprocessing.current_process().name != 'MainProcess':
+        return None
+
+    with _reader_lock:
+        if _warmup_thread is None and reader_status == 'not_loaded':
+            _warmup_thread = threading.Thread(target=init_reader, name='ocr-warmup', daemon=True)
+            _warmup_thread.start()
+    return _warmup_thread
+
+def get_reader():
+    """Return the EasyOCR reader, waiting for a running warm-up or loading it on first use"""
+    with _reader_lock:
+        if _warmup_thread is None and reader_status == 'not_loaded':
+            init_reader()
+    if _warmup_thread is not None:
+        _warmup_thread.join()
+    return reader
+
+def ocr_status():
+    """Which parts of the OCR stack are loaded in this process"""
+    return {
+        'easyocr_reader': reader_status,
+        'easyocr_load_seconds': reader_load_seconds,
+        'modules': {name: name in sys.modules for name in ('torch', 'easyocr', 'cv2', 'pytesseract', 'pdf2image')}
+    }
+
+def use_symptoms(symptoms, matcher=None):
+    """Count these symptoms in the cascade's early-exit check, here and in pool workers started later"""
+    global symptom_counter, _symptoms
+    from symptom_matcher import SymptomMatcher
+
+    matcher = matcher or SymptomMatcher(symptoms)
+    symptom_counter = lambda text: len(matcher.match_indices(text))
+    _symptoms = tuple(symptoms)
+
+def _init_worker(symptoms):
+    """Process pool initializer: workers don't share the app's module state, so they get the symptoms here"""
+    if symptoms:
+        use_symptoms(symptoms)
+
+def _pool_context():
+    """Start method for the pool: fork server, else spawn, but never a fork of this process"""
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload([__name__])
+        return context
+    return multiprocessing.get_context('spawn')
+
+def get_pool():
+    """Return the shared OCR process pool, restarted if the symptoms changed since it started"""
+    global _pool, _pool_symptoms
+
+    with _pool_lock:
+        if _pool is not None and _pool_symptoms != _symptoms:
+            _pool.shutdown(wait=False)  # pages already submitted still finish
+            _pool = None
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=OCR_WORKERS, mp_context=_pool_context(),
+                                        initializer=_init_worker, initargs=(_symptoms,))
+            _pool_symptoms = _symptoms
+        return _pool
+
+def load_image(image):
+    """Return an RGB PIL image from a file path, encoded bytes, PIL image or NumPy array"""
+    if isinstance(image, np.ndarray):
+        image = Image.fromarray(image)
+    elif isinstance(image, (bytes, bytearray, memoryview)):
+        image = Image.open(io.BytesIO(image))
+    elif not isinstance(image, Image.Image):
+        image = Image.open(image)
+
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    return image
+
+def decode_image(image):
+    """Decode an image once into the RGB uint8 array every OCR engine reads"""
+    if isinstance(image, np.ndarray) and image.dtype == np.uint8 and image.ndim == 3 and image.shape[2] == 3:
+        return image
+    return np.asarray(load_image(image))
+
+def _tesseract_read(image):
+    """Run Tesseract and return (text, mean word confidence)"""
+    import pytesseract
+
+    data = pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT)
+
+    # Rebuild the lines from the word boxes
+    lines = {}
+    confidences = []
+    for i, word in enumerate(data['text']):
+        if not word.strip():
+            continue
+        key = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+        lines.setdefault(key, []).append(word)
+        confidence = float(data['conf'][i])
+        if confidence >= 0:
+            confidences.append(confidence)
+
+    text = '\n'.join(' '.join(words) for words in lines.values())
+    return text, (sum(confidences) / len(confidences) if confidences else 0.0)
+
+def _read_tesseract(image, pixels):
+    return _tesseract_read(image)
+
+def _read_otsu_tesseract(image, pixels):
+    import cv2
+
+    gray = cv2.cvtColor(pixels, cv2.COLOR_RGB2GRAY)
+    thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+    return _tesseract_read(Image.fromarray(thresh))
+
+def _read_easyocr(image, pixels):
+    easyocr_reader = get_reader()
+    if not easyocr_reader:
+        return None
+    results = easyocr_reader.readtext(pixels)
+    # RESULTS->  TEXT
+    text = ' '.join([result[1] for result in results])
+    confidence = 100 * sum(result[2] for result in results) / len(results) if results else 0.0
+    return text, confidence
+
+ENGINE_READERS = {
+    'tesseract': _read_tesseract,
+    'otsu_tesseract': _read_otsu_tesseract,
+    'easyocr': _read_easyocr,
+}
+
+def good_enough(text, confidence, min_confidence=None, min_symptoms=None):
+    """Quality signal for stopping the cascade"""
+    min_confidence = OCR_MIN_CONFIDENCE if min_confidence is None else min_confidence
+    min_symptoms = OCR_MIN_SYMPTOMS if min_symptoms is None else min_symptoms
+
+    if not text.strip():
+        return False
+    if confidence >= min_confidence:
+        return True
+    return symptom_counter is not None and symptom_counter(text) >= min_symptoms
+
+def run_ocr_cascade(image, engines=None, min_confidence=None, min_symptoms=None, previous=None):
+    """Run OCR engines in order until the text is good enough
+
+    Returns a dict with the combined text of every engine that ran, the
+    per-engine timings and whether the text was good enough. With previous
+    (such a dict), the cascade continues from its text and timings.
+    """
+    # Engines share the decoded array; the PIL view is only for Tesseract
+    pixels = decode_image(image)
+    image = Image.fromarray(pixels)
+    engines = engines or OCR_ENGINES
+    texts = [previous['text']] if previous and previous['text'] else []
+    runs = list(previous['engines']) if previous else []
+    stopped_early = False
+    finished = False
+
+    for name in engines:
+        start = time.perf_counter()
+        try:
+            read = ENGINE_READERS[name](image, pixels)
+        except Exception as e:
+            logger.warning("OCR engine failed", extra={'engine': name, 'error': str(e)})
+            read = None
+        elapsed = time.perf_counter() - start
+
+        if read is None:
+            continue
+
+        text, confidence = read
+        texts.append(text)
+        runs.append({
+            'engine': name,
+            'seconds': round(elapsed, 4),
+            'confidence': round(confidence, 1),
+            'chars': len(text)
+        })
+
+        if good_enough('\n'.join(texts), confidence, min_confidence, min_symptoms):
+            stopped_early = name != engines[-1]
+            finished = True
+            break
+
+    return {
+        'text': '\n'.join(texts).strip(),
+        'engines': runs,
+        'stopped_early': stopped_early,
+        'good_enough': finished
+    }
+
+def record_timings(result):
+    """Add one cascade result to the per-engine stats and metrics"""
+    for run in result['engines']:
+        OCR_ENGINE_SECONDS.observe(run['seconds'], engine=run['engine'])
+    OCR_CASCADES.inc(stopped_early=str(result['stopped_early']).lower())
+
+    with _stats_lock:
+        for run in result['engines']:
+            stats = engine_stats.setdefault(run['engine'], {'runs': 0, 'seconds': 0.0})
+            stats['runs'] += 1
+            stats['seconds'] += run['seconds']
+
+        totals = engine_stats.setdefault('cascade', {'images': 0, 'early_exits': 0})
+        totals['images'] += 1
+        totals['early_exits'] += int(result['stopped_early'])
+
+def ocr_stats():
+    """Per-engine run counts, total and mean seconds"""
+    stats = {}
+    with _stats_lock:
+        for name, values in engine_stats.items():
+            stats[name] = dict(values)
+            if 'runs' in values:
+                stats[name]['seconds'] = round(values['seconds'], 4)
+                stats[name]['mean_seconds'] = round(values['seconds'] / values['runs'], 4)
+    return stats
+
+def extract_text_from_image(image):
+    """Extract text from an image (path, encoded bytes, PIL image or array) with the OCR cascade"""
+    try:
+        result = run_ocr_cascade(image)
+        record_timings(result)
+        return result['text']
+
+    except Exception:
+        logger.exception("Error extracting text from image")
+        return ""
+
+def iter_pdf_pages(pdf_path, dpi=PDF_DPI, batch=PDF_RENDER_BATCH):
+    """Render PDF pages lazily, batch pages per poppler call"""
+    from pdf2image import convert_from_path, pdfinfo_from_path
+
+    page_count = pdfinfo_from_path(pdf_path)['Pages']
+
+    for first in range(1, page_count + 1, batch):
+        last = min(first + batch - 1, page_count)
+        with metrics.stage_timer('pdf_render'):
+            images = convert_from_path(pdf_path, dpi=dpi, first_page=first, last_page=last)
+        yield from images
+
+def page_hash(image):
+    """Content hash of a rendered page's pixels"""
+    digest = hashlib.sha256(f'{image.mode}:{image.size}:'.encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+def iter_pdf_text(pdf_path, dpi=PDF_DPI, cache=None, namespace=''):
+    """Yield the OCR text of each PDF page, in page order, as pages complete
+
+    With a cache, pages whose pixels were OCRed before under the same
+    namespace are answered from it instead of going through the cascade.
+    """
+    pages = iter_pdf_pages(pdf_path, dpi)
+
+    def lookup(image):
+        if cache is None:
+            return None, None
+        key = f'{namespace}:page:{page_hash(image)}'
+        return key, cache.get(key)
+
+    if OCR_WORKERS <= 1:
+        for image in pages:
+            key, text = lookup(image)
+            if text is None:
+                text = extract_text_from_image(image)
+                _store_page(cache, key, text)
+            yield text
+        return
+
+    # Workers run the cascade up to the first in-process engine; the rest runs here
+    split = next((i for i, name in enumerate(OCR_ENGINES) if name in IN_PROCESS_ENGINES), len(OCR_ENGINES))
+    engines = (OCR_ENGINES[:split], OCR_ENGINES[split:])
+
+    # Keep at most PAGES_IN_FLIGHT pages rendered and queued at any time
+    pool = get_pool()
+    pending = deque()  # (cache key, cached text or future, page image)
+    try:
+        for image in pages:
+            key, text = lookup(image)
+            if text is not None:
+                pending.append((key, text, None))
+            elif engines[0]:
+                pending.append((key, pool.submit(run_ocr_cascade, image, engines[0]), image))
+            else:
+                pending.append((key, None, image))
+            if len(pending) >= PAGES_IN_FLIGHT:
+                yield _page_text(pending.popleft(), engines[1], cache)
+
+        while pending:
+            yield _page_text(pending.popleft(), engines[1], cache)
+    finally:
+        for _, item, _ in pending:
+            if item is not None and not isinstance(item, str):
+                item.cancel()
+
+def _store_page(cache, key, text):
+    if cache is not None and text:
+        cache.put(key, text)
+
+def _page_text(entry, local_engines, cache=None):
+    """Collect a page result from the pool (or the cache), finish its cascade here and record its timings"""
+    key, item, image = entry
+    if isinstance(item, str):
+        return item
+
+    try:
+        result = item.result() if item is not None else None
+        if result is not None and result['good_enough']:
+            result['stopped_early'] = result['stopped_early'] or bool(local_engines)
+        elif local_engines:
+            result = run_ocr_cascade(image, local_engines, previous=result)
+    except Exception:
+        logger.exception("Error extracting text from PDF page")
+        return ""
+
+    record_timings(result)
+    _store_page(cache, key, result['text'])
+    return result['text']
+
+def extract_text_from_pdf(pdf_path):
+    """Extract text from PDF file"""
+    try:
+        return '\n'.join(iter_pdf_text(pdf_path))
+
+    except Exception:
+        logger.exception("Error extracting text from PDF")
+        return ""
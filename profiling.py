@@ -0,0 +1,134 @@
+"""
+Opt-in sampling profiler for slow requests.
+
+While enabled, a background thread samples the stack of every thread that is
+handling a tracked request (sys._current_frames) at a fixed interval. When a
+request finishes, its samples are kept only if it is among the slowest
+`keep` requests seen so far. Profiles are exported as collapsed stacks
+("frame;frame;frame count" lines), the input format of flamegraph.pl and
+speedscope.
+
+Disabled, tracking a request costs a single attribute check.
+"""
+
+import heapq
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+SAMPLE_INTERVAL = 0.005  # seconds between stack samples
+MAX_STACK_DEPTH = 64
+
+
+def _collapse(frame):
+    """'outer;...;inner' frame names for a stack"""
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class _Tracked:
+    __slots__ = ('label', 'thread_id', 'started', 'samples')
+
+    def __init__(self, label, thread_id):
+        self.label = label
+        self.thread_id = thread_id
+        self.started = time.perf_counter()
+        self.samples = Counter()
+
+
+class SlowRequestProfiler:
+    """Keeps sampled stacks of the slowest requests"""
+
+    def __init__(self, keep=10, interval=SAMPLE_INTERVAL):
+        self.keep = keep
+        self.interval = interval
+        self.enabled = False
+        self._active = {}
+        self._slowest = []  # min-heap of (seconds, sequence, profile dict)
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def enable(self, keep=None):
+        with self._lock:
+            if keep is not None:
+                self.keep = keep
+            self.enabled = True
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._sample_loop, name='profiler', daemon=True)
+                self._thread.start()
+
+    def disable(self):
+        self.enabled = False
+
+    def clear(self):
+        with self._lock:
+            self._slowest = []
+
+    def start(self, label):
+        """Start tracking the current thread; returns a token for finish()"""
+        if not self.enabled:
+            return None
+        tracked = _Tracked(label, threading.get_ident())
+        with self._lock:
+            self._active[id(tracked)] = tracked
+        return tracked
+
+    def finish(self, tracked):
+        if tracked is None:
+            return
+        seconds = time.perf_counter() - tracked.started
+        with self._lock:
+            self._active.pop(id(tracked), None)
+            if not tracked.samples:
+                return
+            profile = {'label': tracked.label, 'seconds': round(seconds, 4), 'samples': dict(tracked.samples)}
+            entry = (seconds, next(self._sequence), profile)
+            if len(self._slowest) < self.keep:
+                heapq.heappush(self._slowest, entry)
+            elif seconds > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, entry)
+
+    @contextmanager
+    def track(self, label):
+        tracked = self.start(label)
+        try:
+            yield
+        finally:
+            self.finish(tracked)
+
+    def _sample_loop(self):
+        while self.enabled:
+            time.sleep(self.interval)
+            with self._lock:
+                active = list(self._active.values())
+            if not active:
+                continue
+            frames = sys._current_frames()
+            for tracked in active:
+                frame = frames.get(tracked.thread_id)
+                if frame is not None:
+                    tracked.samples[_collapse(frame)] += 1
+
+    def slowest(self):
+        """Kept profiles, slowest first"""
+        with self._lock:
+            entries = sorted(self._slowest, reverse=True)
+        return [profile for _, _, profile in entries]
+
+    def folded(self):
+        """Collapsed stacks of the kept profiles, each rooted at its request label"""
+        lines = []
+        for profile in self.slowest():
+            root = f"{profile['label']} [{profile['seconds']}s]".replace(';', ',')
+            for stack, count in sorted(profile['samples'].items()):
+                lines.append(f'{root};{stack} {count}')
+        return '\n'.join(lines) + '\n'
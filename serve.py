@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+Production entry point: a prefork master with copy-on-write workers.
+
+    python serve.py --workers 4 --port 5001
+
+The master binds the socket, imports the app (which memory-maps the model
+bundle and builds the symptom indexes), waits for the EasyOCR reader to
+finish loading, freezes the garbage collector and only then forks the
+workers. The model arrays, the indexes and the OCR weights are therefore
+shared copy-on-write pages, so adding a worker costs little more than its
+own request state. Each worker serves the shared socket with werkzeug's
+threaded WSGI server, one thread per connection.
+
+The master's reader is the only EasyOCR model: each worker's PDF OCR pool runs the
+Tesseract stages in its own processes and hands pages that need EasyOCR
+back to the worker, so OCR memory doesn't grow with the pool size.
+
+Threads are pinned per worker so N workers don't each start a thread per
+core: OMP/MKL/OpenBLAS thread counts, torch and OpenCV threads, and the PDF
+OCR process pool all get cores // workers (or --threads).
+
+Reloading is graceful. When the bundle file changes (a retrain in any
+worker writes a new one), or on SIGHUP, the master loads the new model and
+forks a fresh generation of workers. It then sends SIGTERM to the old
+ones, which stop accepting, finish their requests and background jobs, and
+exit. SIGTERM/SIGINT stop everything the same way. Job status is shared
+through a SQLite file, so /jobs polls work whichever worker answers.
+
+werkzeug closes each connection after its response, but it cannot interrupt
+a thread that is waiting on a client which connected and sent nothing, or
+stalled mid-request, and a stopping worker waits for those threads too.
+Connection sockets therefore time out after CLIENT_TIMEOUT seconds, so a stop
+takes at most that much longer than the slowest request. Put a proxy that
+buffers requests and owns client connections (e.g. nginx) in front for slow
+clients.
+"""
+
+import argparse
+import gc
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+from logs import get_logger
+
+# Configuration
+HOST = '0.0.0.0'
+PORT = 5001
+WORKERS = os.cpu_count() or 1
+GRACEFUL_TIMEOUT = 30  # seconds a stopping worker gets to finish requests and jobs
+RELOAD_CHECK_INTERVAL = 2  # seconds between checks of the bundle file
+MIN_WORKER_LIFETIME = 5  # workers dying sooner than this are respawned with a delay
+CLIENT_TIMEOUT = 10  # seconds a client may stay silent (before or during a request) before it is disconnected
+BACKLOG = 2048
+THREAD_ENV_VARS = ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'NUMEXPR_NUM_THREADS')
+
+
+def pin_thread_env(threads):
+    """Limit native thread pools; must run before numpy/torch are imported"""
+    for name in THREAD_ENV_VARS:
+        os.environ.setdefault(name, str(threads))
+
+
+def pin_threads(threads):
+    """Limit the thread pools of libraries already imported in this process"""
+    if 'torch' in sys.modules:
+        torch = sys.modules['torch']
+        torch.set_num_threads(threads)
+        try:
+            torch.set_num_interop_threads(threads)
+        except RuntimeError:
+            pass  # only settable before the first parallel op
+    if 'cv2' in sys.modules:
+        sys.modules['cv2'].setNumThreads(threads)
+
+
+def warm_ocr(ocr):
+    """Load the EasyOCR reader and import the OCR stack in the master, before forking"""
+    ocr.start_warmup()
+    ocr.get_reader()
+    for name in ('cv2', 'pytesseract', 'pdf2image'):
+        try:
+            __import__(name)
+        except ImportError:
+            pass
+
+
+def request_handler():
+    """werkzeug's request handler with a timeout on the connection socket"""
+    from werkzeug.serving import WSGIRequestHandler
+
+    class Handler(WSGIRequestHandler):
+        timeout = CLIENT_TIMEOUT
+
+    return Handler
+
+
+def run_worker(app_module, listener, host, port, threads, graceful_timeout):
+    """Body of a forked worker: serve until SIGTERM, then drain and return"""
+    from werkzeug.serving import make_server
+
+    # The master coordinates shutdown and reloads
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+    pin_threads(threads)
+    app_module.ocr.OCR_WORKERS = threads
+    app_module.ocr.PAGES_IN_FLIGHT = 2 * threads
+    if app_module.profiler.enabled:
+        app_module.profiler.enable()  # its sampler thread did not survive the fork
+
+    server = make_server(host, port, app_module.app, threaded=True, request_handler=request_handler(),
+                         fd=listener.fileno())
+    server.daemon_threads = False  # so server_close() waits for in-flight requests
+    stopping = threading.Event()
+
+    def stop(signum, frame):
+        if not stopping.is_set():
+            stopping.set()
+            # shutdown() blocks until serve_forever() returns, so not from this thread
+            threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    server.serve_forever()
+    server.server_close()
+
+    deadline = time.monotonic() + graceful_timeout
+    for jobs in (app_module.upload_jobs, app_module.retrain_jobs):
+        jobs.wait(max(deadline - time.monotonic(), 0))
+
+
+class Master:
+    """Forks, watches and replaces the worker processes"""
+
+    def __init__(self, app_module, listener, host, port, workers, threads,
+                 graceful_timeout=GRACEFUL_TIMEOUT, reload_interval=RELOAD_CHECK_INTERVAL):
+        self.app = app_module
+        self.listener = listener
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.threads = threads
+        self.graceful_timeout = graceful_timeout
+        self.reload_interval = reload_interval
+        self.logger = get_logger('serve')
+
+        self.generation = 0
+        self.children = {}  # pid -> (generation, started)
+        self.kill_at = {}  # pid of a stopping worker -> time it gets SIGKILL
+        self.stopping = False
+        self.reload_requested = False
+        self.respawn_after = 0
+        self.bundle_stat = self._stat_bundle()
+
+    def _stat_bundle(self):
+        try:
+            stat = os.stat(self.app.MODEL_BUNDLE_PATH)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(self.app, self.listener, self.host, self.port, self.threads, self.graceful_timeout)
+            except BaseException:
+                self.logger.exception("Worker failed")
+                code = 1
+            finally:
+                os._exit(code)
+
+        self.children[pid] = (self.generation, time.monotonic())
+        self.logger.info("Worker started", extra={'pid': pid, 'generation': self.generation,
+                                                   'model_version': self.app.current_model.version})
+
+    def retire(self, pids):
+        """Ask workers to finish their requests and exit"""
+        for pid in pids:
+            if pid in self.children and pid not in self.kill_at:
+                self.kill_at[pid] = time.monotonic() + self.graceful_timeout + 5
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+
+    def reap(self):
+        """Collect exited workers"""
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            generation, started = self.children.pop(pid, (None, 0))
+            retiring = self.kill_at.pop(pid, None) is not None
+            if not retiring and not self.stopping:
+                self.logger.warning("Worker exited unexpectedly",
+                                    extra={'pid': pid, 'exit_code': os.waitstatus_to_exitcode(status)})
+                if time.monotonic() - started < MIN_WORKER_LIFETIME:
+                    self.respawn_after = time.monotonic() + 1
+
+    def kill_overdue(self):
+        now = time.monotonic()
+        for pid, deadline in list(self.kill_at.items()):
+            if now >= deadline:
+                self.logger.warning("Worker did not stop in time, killing it", extra={'pid': pid})
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                self.kill_at[pid] = float('inf')
+
+    def reload(self):
+        """Load the current bundle and replace every worker with one forked from the new state"""
+        from model_bundle import load_bundle, BundleError
+
+        self.reload_requested = False
+        self.bundle_stat = self._stat_bundle()
+        try:
+            bundle = load_bundle(self.app.MODEL_BUNDLE_PATH)
+        except (OSError, BundleError) as e:
+            self.logger.error("Reload failed, keeping the current workers", extra={'error': str(e)})
+            return
+
+        state = self.app.use_bundle(bundle)
+        gc.freeze()
+        self.logger.info("Model reloaded", extra={'model_version': state.version, 'checksum': state.checksum})
+
+        old = list(self.children)
+        self.generation += 1
+        for _ in range(self.workers):
+            self.spawn()
+        self.retire(old)
+
+    def run(self):
+        def request_stop(signum, frame):
+            self.stopping = True
+
+        def request_reload(signum, frame):
+            self.reload_requested = True
+
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+        signal.signal(signal.SIGHUP, request_reload)
+
+        # Objects that exist now are never collected, so the GC doesn't dirty their shared pages
+        gc.freeze()
+        for _ in range(self.workers):
+            self.spawn()
+        self.logger.info("Serving", extra={'host': self.host, 'port': self.port,
+                                           'workers': self.workers, 'threads_per_worker': self.threads})
+
+        next_check = time.monotonic() + self.reload_interval
+        while not self.stopping:
+            self.reap()
+            self.kill_overdue()
+
+            if time.monotonic() >= next_check:
+                next_check = time.monotonic() + self.reload_interval
+                if self._stat_bundle() != self.bundle_stat:
+                    self.reload_requested = True
+            if self.reload_requested:
+                self.reload()
+
+            current = sum(1 for generation, _ in self.children.values() if generation == self.generation)
+            if current < self.workers and time.monotonic() >= self.respawn_after:
+                self.spawn()
+            time.sleep(0.2)
+
+        self.shutdown()
+
+    def shutdown(self):
+        """Stop every worker gracefully, killing the ones that overrun"""
+        self.logger.info("Shutting down", extra={'workers': len(self.children)})
+        self.retire(list(self.children))
+        while self.children:
+            self.reap()
+            self.kill_overdue()
+            time.sleep(0.1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    parser.add_argument('--threads', type=int, help='native threads per worker (default: cores // workers)')
+    parser.add_argument('--graceful-timeout', type=float, default=GRACEFUL_TIMEOUT)
+    parser.add_argument('--reload-interval', type=float, default=RELOAD_CHECK_INTERVAL,
+                        help='seconds between checks of the model bundle for changes')
+    args = parser.parse_args()
+
+    workers = max(1, args.workers)
+    threads = args.threads or max(1, (os.cpu_count() or 1) // workers)
+
+    # Before the app (and numpy) is imported, so every worker inherits the limits
+    pin_thread_env(threads)
+    job_dir = tempfile.mkdtemp(prefix='serve-jobs-')
+    os.environ.setdefault('JOB_STORE_DB', os.path.join(job_dir, 'jobs.sqlite'))
+
+    listener = socket.create_server((args.host, args.port), backlog=BACKLOG)
+    try:
+        import app as app_module
+
+        pin_threads(threads)
+        warm_ocr(app_module.ocr)
+        Master(app_module, listener, args.host, args.port, workers, threads,
+               args.graceful_timeout, args.reload_interval).run()
+    finally:
+        listener.close()
+        shutil.rmtree(job_dir, ignore_errors=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -126,10 +126,18 @@ async function handleFileSelect() {
 
         const data = await response.json();
 
-        if (response.ok && data.success) {
-            showOCRResults(data);
-        } else {
+        if (!response.ok || !data.success) {
             showAlert(data.error || 'Failed to process file', 'danger');
+            return;
+        }
+
+        // OCR runs in the background; wait for the job to finish
+        const job = await waitForJob(data.status_url);
+
+        if (job.status === 'done') {
+            showOCRResults(job.result);
+        } else {
+            showAlert(job.error || 'Failed to process file', 'danger');
         }
     } catch (error) {
         console.error('Upload error:', error);
@@ -139,6 +147,19 @@ async function handleFileSelect() {
     }
 }
 
+// Poll a background job until it is done or failed
+async function waitForJob(statusUrl, intervalMs = 1000) {
+    while (true) {
+        const response = await fetch(statusUrl);
+        const job = await response.json();
+
+        if (!response.ok || job.status === 'done' || job.status === 'failed') {
+            return job;
+        }
+        await new Promise(resolve => setTimeout(resolve, intervalMs));
+    }
+}
+
 // Show upload progress
 function showUploadProgress() {
     const progressDiv = document.getElementById('uploadProgress');
@@ -264,18 +285,59 @@ function setupEventListeners() {
 }
 
 // Filter symptoms based on search
+let searchTimer = null;
+let searchSequence = 0;
+
 function filterSymptoms() {
-    const searchTerm = document.getElementById('symptomSearch').value.toLowerCase();
-    const symptomItems = document.querySelectorAll('.symptom-item');
-    
-    symptomItems.forEach(item => {
-        const label = item.querySelector('.symptom-label').textContent.toLowerCase();
-        if (label.includes(searchTerm)) {
-            item.style.display = 'block';
-        } else {
-            item.style.display = 'none';
+    // Wait for a pause in typing before asking the server
+    clearTimeout(searchTimer);
+    searchTimer = setTimeout(runSymptomSearch, 150);
+}
+
+// Ranked, typo-tolerant search on the server; falls back to a local substring filter
+async function runSymptomSearch() {
+    const searchTerm = document.getElementById('symptomSearch').value.trim();
+    const sequence = ++searchSequence;
+
+    if (!searchTerm) {
+        showSymptomItems(null);
+        return;
+    }
+
+    try {
+        const params = new URLSearchParams({ q: searchTerm, limit: 50 });
+        const response = await fetch(`/api/symptoms/search?${params}`);
+        const data = await response.json();
+        if (sequence !== searchSequence) return; // a newer search is running
+        showSymptomItems(data.results.map(result => result.symptom));
+    } catch (error) {
+        console.error('Symptom search error:', error);
+        const term = searchTerm.toLowerCase();
+        showSymptomItems((window.symptomsData || []).filter(symptom =>
+            formatSymptomName(symptom).toLowerCase().includes(term)
+        ));
+    }
+}
+
+// Show only the given symptoms, in that order (null shows all in the original order)
+function showSymptomItems(symptoms) {
+    const symptomsGrid = document.getElementById('symptomsGrid');
+    if (!symptomsGrid) return;
+
+    const order = symptoms || window.symptomsData || [];
+    const shown = new Set(order);
+
+    order.forEach(symptom => {
+        const checkbox = document.getElementById(`symptom_${symptom}`);
+        if (checkbox) {
+            symptomsGrid.appendChild(checkbox.closest('.symptom-item'));
         }
     });
+
+    symptomsGrid.querySelectorAll('.symptom-item').forEach(item => {
+        const symptom = item.querySelector('.symptom-checkbox').id.replace('symptom_', '');
+        item.style.display = shown.has(symptom) ? 'block' : 'none';
+    });
 }
 
 // Handle symptom selection
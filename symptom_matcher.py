@@ -0,0 +1,162 @@
+"""
+Aho-Corasick matcher for finding symptom names in OCR text.
+
+The automaton is built once from the model's symptom list and finds every
+occurrence of every symptom pattern in a single pass over the text. For each
+symptom it matches the spaced form ("skin rash") and the underscored form
+("skin_rash") as exact matches, and every word longer than three letters
+("rash") as a partial match. This is the same rule the old per-symptom
+substring scan used.
+"""
+
+from collections import deque, namedtuple
+
+EXACT = 'exact'
+PARTIAL = 'partial'
+
+# A single pattern occurrence; start/end index into the lowercased text
+Match = namedtuple('Match', ['symptom', 'start', 'end', 'kind', 'pattern'])
+
+
+def symptom_patterns(symptom):
+    """Return the (pattern, kind) pairs that identify a symptom in text"""
+    readable = symptom.replace('_', ' ').lower()
+    patterns = [(readable, EXACT), (symptom, EXACT)]
+    patterns += [(word, PARTIAL) for word in readable.split() if len(word) > 3]
+    return patterns
+
+
+class SymptomMatcher:
+    """Aho-Corasick automaton over all symptom patterns"""
+
+    def __init__(self, symptoms):
+        self.symptoms = list(symptoms)
+        self.patterns = []     # (pattern, symptom index, kind)
+        self._delta = [{}]     # state -> {char: next state}, failure links already folded in
+        self._outputs = [()]   # state -> pattern ids ending at this state
+
+        pattern_ids = {}
+        for index, symptom in enumerate(self.symptoms):
+            for pattern, kind in symptom_patterns(symptom):
+                key = (pattern, index)
+                if not pattern or key in pattern_ids:
+                    continue
+                pattern_ids[key] = len(self.patterns)
+                self.patterns.append((pattern, index, kind))
+                self._add_pattern(pattern, pattern_ids[key])
+
+        self._build_failure_links()
+
+    def _add_pattern(self, pattern, pattern_id):
+        state = 0
+        for char in pattern:
+            next_state = self._delta[state].get(char)
+            if next_state is None:
+                next_state = len(self._delta)
+                self._delta.append({})
+                self._outputs.append(())
+                self._delta[state][char] = next_state
+            state = next_state
+        self._outputs[state] += (pattern_id,)
+
+    def _build_failure_links(self):
+        """Turn the trie into a DFA: one dict lookup per character of text
+
+        A missing transition always means "back to the root".
+        """
+        trie = [dict(edges) for edges in self._delta]
+        fail = [0] * len(trie)
+        queue = deque()
+
+        for state in trie[0].values():
+            queue.append(state)
+
+        while queue:
+            state = queue.popleft()
+            # Inherit transitions (and outputs) from the failure state
+            fallback = self._delta[fail[state]]
+            self._outputs[state] += self._outputs[fail[state]]
+            for char, target in fallback.items():
+                self._delta[state].setdefault(char, target)
+            for char, child in trie[state].items():
+                fail[child] = self._delta[fail[state]].get(char, 0)
+                queue.append(child)
+
+    def stream(self):
+        """Return a MatchStream for feeding text chunk by chunk"""
+        return MatchStream(self)
+
+    def find_matches(self, text):
+        """Return every pattern occurrence in text, in order of end position"""
+        matches = self.stream()
+        matches.feed(text)
+        return matches.matches()
+
+    def match_symptoms(self, text):
+        """Return the symptoms mentioned in text, in model order"""
+        return [self.symptoms[index] for index in self.match_indices(text)]
+
+    def match_indices(self, text):
+        """Return the column indices of the symptoms mentioned in text, in model order"""
+        if not text:
+            return []
+        matches = self.stream()
+        matches.feed(text)
+        return matches.indices()
+
+
+class MatchStream:
+    """Incremental matching state; matches may span chunk boundaries"""
+
+    def __init__(self, matcher):
+        self.matcher = matcher
+        self._hits = []     # (end position, accepting state)
+        self._state = 0
+        self._offset = 0
+
+    def feed(self, chunk):
+        """Scan the next chunk of text"""
+        delta = self.matcher._delta
+        outputs = self.matcher._outputs
+        hits = self._hits
+        state = self._state
+        chunk = chunk.lower()
+
+        # Only accepting states are recorded here; Match objects are built on demand
+        for position, char in enumerate(chunk, self._offset + 1):
+            state = delta[state].get(char, 0)
+            if outputs[state]:
+                hits.append((position, state))
+
+        self._state = state
+        self._offset += len(chunk)
+
+    def matches(self):
+        """Every pattern occurrence seen so far, with spans and match type"""
+        outputs = self.matcher._outputs
+        patterns = self.matcher.patterns
+        symptoms = self.matcher.symptoms
+
+        found = []
+        for position, state in self._hits:
+            for pattern_id in outputs[state]:
+                pattern, index, kind = patterns[pattern_id]
+                found.append(Match(symptoms[index], position - len(pattern), position, kind, pattern))
+        return found
+
+    def symptoms(self, kind=None):
+        """Symptoms matched so far (optionally only EXACT or PARTIAL), in model order"""
+        return [self.matcher.symptoms[index] for index in self.indices(kind)]
+
+    def indices(self, kind=None):
+        """Column indices of the symptoms matched so far, in model order"""
+        outputs = self.matcher._outputs
+        patterns = self.matcher.patterns
+
+        found = set()
+        for state in {state for _, state in self._hits}:
+            for pattern_id in outputs[state]:
+                _, index, pattern_kind = patterns[pattern_id]
+                if kind is None or pattern_kind == kind:
+                    found.add(index)
+        return sorted(found)
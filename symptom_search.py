@@ -0,0 +1,115 @@
+"""
+Search index over the symptom names for /api/symptoms/search.
+
+Built once per model from its symptom list. A query is matched against the
+readable names ("skin rash" for "skin_rash") and ranked in tiers:
+
+  0. the whole name
+  1. the start of the name
+  2. every query word is the start of a word in the name ("sk ra")
+  3. anywhere in the name
+  4. close enough by trigrams, word by word, for typos ("fevr", "chest pian")
+
+Word prefixes come from a sorted word list (bisect), fuzzy candidates from
+an inverted trigram index, so a query only touches the names it can match.
+Within a tier, names sharing more trigrams with the query come first.
+"""
+
+import bisect
+import re
+from collections import Counter, defaultdict, namedtuple
+
+FUZZY_THRESHOLD = 0.5  # share of each query word's trigrams found in its closest name word, on average
+DEFAULT_LIMIT = 20
+
+SearchResult = namedtuple('SearchResult', ['symptom', 'tier', 'similarity'])
+
+
+def normalize(text):
+    """Lowercase words separated by single spaces ("Skin_Rash " -> "skin rash")"""
+    return ' '.join(re.split(r'[\s_]+', text.lower())).strip()
+
+
+def trigrams(text):
+    """Trigrams of each word, padded so word starts and ends count"""
+    grams = set()
+    for word in text.split():
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class SymptomIndex:
+    """Prefix and trigram index over symptom names"""
+
+    def __init__(self, symptoms):
+        self.symptoms = list(symptoms)
+        self.names = [normalize(symptom) for symptom in self.symptoms]
+        self.name_trigrams = [trigrams(name) for name in self.names]
+        self.word_trigrams = [[trigrams(word) for word in name.split()] for name in self.names]
+
+        # (word, symptom id) pairs sorted for prefix lookups
+        self.words = sorted({(word, i) for i, name in enumerate(self.names) for word in name.split()})
+        self._word_keys = [word for word, _ in self.words]
+
+        self.postings = defaultdict(list)  # trigram -> symptom ids
+        for i, grams in enumerate(self.name_trigrams):
+            for gram in grams:
+                self.postings[gram].append(i)
+
+    def _word_prefix_ids(self, prefix):
+        """Ids of symptoms with a word starting with prefix"""
+        start = bisect.bisect_left(self._word_keys, prefix)
+        ids = set()
+        for word, i in self.words[start:]:
+            if not word.startswith(prefix):
+                break
+            ids.add(i)
+        return ids
+
+    def _fuzzy_score(self, word_grams, i):
+        """Mean over query words of the share of their trigrams found in the closest word of name i"""
+        total = 0.0
+        for grams in word_grams:
+            total += max(len(grams & name_grams) for name_grams in self.word_trigrams[i]) / len(grams)
+        return total / len(word_grams)
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        """Best matching symptoms as SearchResults, best first"""
+        query = normalize(query)
+        if not query:
+            return []
+
+        query_grams = trigrams(query)
+        word_grams = [trigrams(word) for word in query.split()]
+        shared = Counter()
+        for gram in query_grams:
+            shared.update(self.postings.get(gram, ()))
+
+        # Every query word must start a word of the name
+        words = query.split()
+        prefix_ids = self._word_prefix_ids(words[0])
+        for word in words[1:]:
+            prefix_ids &= self._word_prefix_ids(word)
+
+        candidates = set(shared) | prefix_ids
+        results = []
+        for i in candidates:
+            name = self.names[i]
+            if name == query:
+                tier = 0
+            elif name.startswith(query):
+                tier = 1
+            elif i in prefix_ids:
+                tier = 2
+            elif query in name:
+                tier = 3
+            elif self._fuzzy_score(word_grams, i) >= FUZZY_THRESHOLD:
+                tier = 4
+            else:
+                continue
+            union = len(query_grams) + len(self.name_trigrams[i]) - shared[i]
+            results.append(SearchResult(self.symptoms[i], tier, shared[i] / union if union else 0.0))
+
+        results.sort(key=lambda r: (r.tier, -r.similarity, len(r.symptom), r.symptom))
+        return results[:limit]
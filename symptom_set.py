@@ -0,0 +1,122 @@
+"""
+Compact symptom sets.
+
+A SymptomSet is an integer bitmask over a model's symptom columns (bit i set
+= symptom i present), so 132 symptoms fit in three 64-bit words. Union,
+intersection and hashing are single integer operations, the mask itself is
+the prediction cache key, and a batch of sets unpacks straight into the
+uint8 feature matrix the forest engine scores.
+
+Sets are tied to the SymptomVocabulary (one per loaded model) that maps
+names to columns; sets from different vocabularies can't be combined.
+"""
+
+import numpy as np
+
+
+class SymptomVocabulary:
+    """Symptom names <-> feature columns for one model"""
+
+    def __init__(self, symptoms):
+        self.names = tuple(symptoms)
+        self.index = {name: i for i, name in enumerate(self.names)}  # symptom name -> feature column
+        self.n_bytes = (len(self.names) + 7) // 8
+        self.index_dtype = np.uint8 if len(self.names) <= 256 else np.uint16
+        self.empty = SymptomSet(self, 0)
+
+    def __len__(self):
+        return len(self.names)
+
+    def encode(self, names):
+        """SymptomSet of the known names (unknown ones are ignored)"""
+        mask = 0
+        for name in names:
+            col = self.index.get(name)
+            if col is not None:
+                mask |= 1 << col
+        return SymptomSet(self, mask)
+
+    def from_indices(self, indices):
+        """SymptomSet from feature column indices"""
+        mask = 0
+        for col in indices:
+            mask |= 1 << int(col)
+        return SymptomSet(self, mask)
+
+    def unknown(self, names):
+        """The names that are not symptoms of this vocabulary"""
+        return [name for name in names if name not in self.index]
+
+    def matrix(self, sets):
+        """uint8 feature matrix with one row per set"""
+        packed = b''.join(s.mask.to_bytes(self.n_bytes, 'little') for s in sets)
+        bits = np.frombuffer(packed, dtype=np.uint8).reshape(len(sets), self.n_bytes)
+        return np.unpackbits(bits, axis=1, count=len(self.names), bitorder='little')
+
+
+class SymptomSet:
+    """Immutable set of symptoms stored as a bitmask over a vocabulary"""
+
+    __slots__ = ('vocabulary', 'mask')
+
+    def __init__(self, vocabulary, mask):
+        self.vocabulary = vocabulary
+        self.mask = mask
+
+    def indices(self):
+        """Feature column indices in model order, as a small integer array"""
+        mask = self.mask
+        cols = []
+        while mask:
+            low = mask & -mask
+            cols.append(low.bit_length() - 1)
+            mask ^= low
+        return np.array(cols, dtype=self.vocabulary.index_dtype)
+
+    def names(self):
+        """Symptom names in model order"""
+        return [self.vocabulary.names[col] for col in self.indices().tolist()]
+
+    def to_row(self):
+        """Dense uint8 feature vector"""
+        return self.vocabulary.matrix([self])[0]
+
+    def _check(self, other):
+        if other.vocabulary is not self.vocabulary:
+            raise ValueError("Symptom sets belong to different vocabularies")
+
+    def __or__(self, other):
+        self._check(other)
+        return SymptomSet(self.vocabulary, self.mask | other.mask)
+
+    def __and__(self, other):
+        self._check(other)
+        return SymptomSet(self.vocabulary, self.mask & other.mask)
+
+    def __sub__(self, other):
+        self._check(other)
+        return SymptomSet(self.vocabulary, self.mask & ~other.mask)
+
+    def __contains__(self, name):
+        col = self.vocabulary.index.get(name)
+        return col is not None and bool(self.mask >> col & 1)
+
+    def __iter__(self):
+        return iter(self.names())
+
+    def __len__(self):
+        return self.mask.bit_count()
+
+    def __bool__(self):
+        return self.mask != 0
+
+    def __eq__(self, other):
+        if not isinstance(other, SymptomSet):
+            return NotImplemented
+        return self.vocabulary is other.vocabulary and self.mask == other.mask
+
+    def __hash__(self):
+        return hash(self.mask)
+
+    def __repr__(self):
+        return f"SymptomSet({self.names()!r})"
@@ -0,0 +1,77 @@
+"""FlatForest must reproduce RandomForestClassifier.predict_proba exactly"""
+
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+import forest_engine
+from dataset import load_dataset
+from forest_engine import export_forest
+from model_bundle import load_bundle, write_bundle
+
+
+@pytest.fixture(scope='module')
+def model():
+    data = load_dataset('Training.csv')
+    return RandomForestClassifier(n_estimators=25, random_state=67).fit(data.features, data.labels)
+
+
+@pytest.fixture(scope='module')
+def rows(model):
+    """Training-like rows plus sparse random ones, which reach rarely used leaves"""
+    rng = np.random.default_rng(0)
+    training = load_dataset('Training.csv').features[::7]
+    random = (rng.random((1500, model.n_features_in_)) < 0.04).astype(np.uint8)
+    return np.concatenate([training, random])
+
+
+@pytest.mark.parametrize('n_rows', [1, 3, 4, 100, 2203])
+def test_predict_proba_matches_sklearn(model, rows, n_rows):
+    forest = export_forest(model)
+    X = rows[:n_rows]
+    assert np.array_equal(forest.predict_proba(X), model.predict_proba(X))
+    assert np.array_equal(forest.predict(X), model.predict(X))
+
+
+def test_bitsets_match_level_walk(model, rows, monkeypatch):
+    forest = export_forest(model).prepare()
+    leaves = forest.apply(rows)
+    assert np.array_equal(leaves, model.apply(rows) + forest.roots)
+
+    monkeypatch.setattr(forest_engine, '_is_binary', lambda X: False)
+    assert np.array_equal(forest.apply(rows), leaves)
+
+
+def test_non_binary_rows_use_level_walk(model, rows):
+    X = rows * np.float32(0.7) + (rows == 0) * np.float32(-0.2)
+    forest = export_forest(model)
+    assert np.array_equal(forest.predict_proba(X), model.predict_proba(X))
+
+
+def test_oversized_bitsets_fall_back(model, rows, monkeypatch):
+    monkeypatch.setattr(forest_engine, 'MAX_BITSET_BYTES', 0)
+    forest = export_forest(model)
+    assert np.array_equal(forest.predict_proba(rows), model.predict_proba(rows))
+
+
+def test_scoring_needs_no_sklearn(model, rows, tmp_path):
+    path = str(tmp_path / 'model.bundle')
+    write_bundle(path, export_forest(model), model.classes_, [f's{i}' for i in range(model.n_features_in_)])
+    np.save(tmp_path / 'rows.npy', rows)
+    script = (
+        "import sys, numpy as np\n"
+        "from model_bundle import load_bundle\n"
+        f"load_bundle({path!r}).forest.predict_proba(np.load({str(tmp_path / 'rows.npy')!r}))\n"
+        "assert 'sklearn' not in sys.modules\n"
+    )
+    subprocess.run([sys.executable, '-c', script], check=True)
+
+
+def test_bundle_round_trip(model, rows, tmp_path):
+    path = str(tmp_path / 'model.bundle')
+    write_bundle(path, export_forest(model), model.classes_, [f's{i}' for i in range(model.n_features_in_)])
+    forest = load_bundle(path).forest
+    assert np.array_equal(forest.predict_proba(rows), model.predict_proba(rows))
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Model training.
+
+train_and_save() fits the Random Forest on Training.csv (plus any labelled
+rows appended later), then writes the legacy pickles and the model bundle.
+app.py calls it directly when no model exists at startup. /admin/retrain runs
+this file as a separate process instead, so serving never blocks on training:
+options are read as JSON from stdin and progress is written to stdout as one
+JSON object per line.
+"""
+
+import csv
+import json
+import os
+import pickle
+import sys
+import tempfile
+import time
+import numpy as np
+from forest_engine import export_forest
+from model_bundle import write_bundle
+from dataset import Dataset, load_dataset, concat_datasets
+from triage import count_by_class
+
+TRAINING_PATH = 'Training.csv'
+EXTRA_TRAINING_PATH = 'Training_extra.csv'  # labelled rows added through /admin/retrain
+MODEL_PATH = 'disease_model.pkl'
+ENCODER_PATH = 'label_encoder.pkl'
+SYMPTOMS_PATH = 'symptom_names.pkl'
+MODEL_PARAMS_PATH = 'model_params.json'  # written by tuning.py
+
+# Same parameters as in the notebook; used when there is no model_params.json
+N_ESTIMATORS = 100
+MAX_DEPTH = None
+MIN_SAMPLES_SPLIT = 2
+RANDOM_STATE = 67
+
+def load_model_params():
+    """Forest parameters for a refit: the tuned ones if tuning.py saved any, else the defaults"""
+    params = {
+        'n_estimators': N_ESTIMATORS,
+        'max_depth': MAX_DEPTH,
+        'min_samples_split': MIN_SAMPLES_SPLIT,
+        'random_state': RANDOM_STATE
+    }
+    if os.path.exists(MODEL_PARAMS_PATH):
+        with open(MODEL_PARAMS_PATH) as f:
+            saved = json.load(f)
+        params.update((key, saved[key]) for key in params if key in saved)
+    return params
+
+def load_training_data():
+    """Load Training.csv and the appended rows as one Dataset (uint8 features)"""
+    data = load_dataset(TRAINING_PATH)
+
+    if os.path.exists(EXTRA_TRAINING_PATH):
+        data = concat_datasets(data, load_dataset(EXTRA_TRAINING_PATH))
+
+    return data
+
+def rows_dataset(rows, symptom_names):
+    """Labelled rows ({'symptoms': [...], 'prognosis': name}) as a Dataset"""
+    columns = {name: i for i, name in enumerate(symptom_names)}
+    features = np.zeros((len(rows), len(symptom_names)), dtype=np.uint8)
+    for i, row in enumerate(rows):
+        features[i, [columns[symptom] for symptom in row['symptoms'] if symptom in columns]] = 1
+    labels = np.array([row['prognosis'] for row in rows], dtype=str)
+    return Dataset(features, labels, list(symptom_names), None)
+
+def append_training_rows(rows, symptom_names):
+    """Append labelled rows ({'symptoms': [...], 'prognosis': name}) to the extra data file"""
+    write_header = not os.path.exists(EXTRA_TRAINING_PATH)
+
+    with open(EXTRA_TRAINING_PATH, 'a', newline='') as f:
+        writer = csv.writer(f)
+        if write_header:
+            writer.writerow(list(symptom_names) + ['prognosis'])
+        for row in rows:
+            present = set(row['symptoms'])
+            writer.writerow([int(symptom in present) for symptom in symptom_names] + [row['prognosis']])
+
+def save_pickle(obj, path):
+    """Pickle obj to path atomically"""
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix='.pickle-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(obj, f)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+def _load_previous_model(symptom_names, labels):
+    """Return (model, encoder) to grow with warm_start, or None if a refit is needed"""
+    try:
+        with open(MODEL_PATH, 'rb') as f:
+            model = pickle.load(f)
+        with open(ENCODER_PATH, 'rb') as f:
+            encoder = pickle.load(f)
+        with open(SYMPTOMS_PATH, 'rb') as f:
+            previous_symptoms = pickle.load(f)
+    except Exception:
+        return None
+
+    # New symptoms or diseases change the trees' inputs/outputs
+    if list(previous_symptoms) != list(symptom_names) or not set(labels) <= set(encoder.classes_):
+        return None
+    return model, encoder
+
+def train_and_save(bundle_path, rows=None, extra_trees=0, n_jobs=-1, progress=None):
+    """Fit or grow the forest, save the pickles and bundle, and return a summary
+
+    With extra_trees > 0 the current forest keeps its trees and only
+    extra_trees new ones are fitted (warm_start); otherwise the forest is
+    refit from scratch. New rows are trained on, then appended to the extra
+    data file only once the new model is saved.
+    """
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.preprocessing import LabelEncoder
+
+    report = progress or (lambda **fields: None)
+    started = time.perf_counter()
+
+    report(stage='loading_data')
+    data = load_training_data()
+    symptom_names = list(data.symptoms)
+    if rows:
+        data = concat_datasets(data, rows_dataset(rows, symptom_names))
+
+    X = data.features
+    labels = data.labels
+
+    previous = _load_previous_model(symptom_names, labels) if extra_trees > 0 else None
+    if previous:
+        model, encoder = previous
+        model.set_params(warm_start=True, n_estimators=model.n_estimators + extra_trees, n_jobs=n_jobs)
+        mode = 'warm_start'
+    else:
+        encoder = LabelEncoder().fit(labels)
+        model = RandomForestClassifier(n_jobs=n_jobs, **load_model_params())
+        mode = 'refit'
+
+    report(stage='fitting', mode=mode, n_samples=len(labels), n_estimators=model.n_estimators)
+    y = encoder.transform(labels)
+    model.fit(X, y)
+    fit_seconds = time.perf_counter() - started
+
+    # Save the new model; the bundle goes last since the app loads it
+    report(stage='saving')
+    model.set_params(warm_start=False, n_jobs=None)
+    save_pickle(model, MODEL_PATH)
+    save_pickle(encoder, ENCODER_PATH)
+    save_pickle(symptom_names, SYMPTOMS_PATH)
+    # Per-class symptom counts of exactly these rows, for triage
+    symptom_counts, class_counts = count_by_class(X, y, len(encoder.classes_))
+    checksum = write_bundle(bundle_path, export_forest(model), encoder.classes_, symptom_names,
+                            extras={'symptom_counts': symptom_counts, 'class_counts': class_counts})
+    if rows:
+        append_training_rows(rows, symptom_names)
+
+    return {
+        'mode': mode,
+        'n_samples': len(labels),
+        'n_estimators': model.n_estimators,
+        'max_depth': model.max_depth,
+        'min_samples_split': model.min_samples_split,
+        'n_symptoms': len(symptom_names),
+        'n_diseases': len(encoder.classes_),
+        'checksum': checksum,
+        'fit_seconds': round(fit_seconds, 3),
+        'seconds': round(time.perf_counter() - started, 3)
+    }
+
+def main():
+    """Run one training from JSON options on stdin, reporting progress on stdout"""
+    options = json.load(sys.stdin)
+
+    def report(**fields):
+        print(json.dumps(fields), flush=True)
+
+    summary = train_and_save(
+        options['bundle_path'],
+        rows=options.get('rows'),
+        extra_trees=options.get('extra_trees', 0),
+        n_jobs=options.get('n_jobs', -1),
+        progress=report
+    )
+    report(stage='done', summary=summary)
+
+if __name__ == "__main__":
+    main()
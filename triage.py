@@ -0,0 +1,112 @@
+"""
+Next-best-question triage.
+
+Given the symptoms a patient has confirmed (and those they have denied),
+rank every other symptom by the expected information gain of asking about
+it: how much, on average, its answer would reduce the entropy (in bits) of
+the distribution over diseases.
+
+  - "yes" branch: the forest's P(disease | S + j), computed for every
+    candidate j in one batched predict_proba call on the flat engine
+  - "no" branch: the current posterior reweighted by P(j absent | disease)
+  - P(yes): sum over diseases of P(disease | S) * P(j | disease)
+
+P(j | disease) comes from symptom frequencies per disease in the training
+data (Laplace-smoothed). Denied symptoms reweight the current posterior the
+same way, since the model itself only sees present symptoms. training.py
+counts them from the rows the forest was fitted on and stores the counts in
+the model bundle, so the two always describe the same data.
+"""
+
+from collections import namedtuple
+import numpy as np
+
+SMOOTHING = 0.5  # pseudo-count for the per-disease symptom frequencies
+
+Suggestion = namedtuple('Suggestion', ['symptom', 'information_gain', 'p_yes'])
+TriageResult = namedtuple('TriageResult', ['posterior', 'entropy', 'suggestions'])
+
+
+def entropy(probabilities):
+    """Shannon entropy in bits along the last axis"""
+    p = np.clip(probabilities, 1e-300, 1.0)
+    return -(probabilities * np.log2(p)).sum(axis=-1)
+
+
+def count_by_class(features, class_indices, n_classes):
+    """(symptom counts per class, rows per class) of a training set, by class index"""
+    class_indices = np.asarray(class_indices)
+    class_counts = np.bincount(class_indices, minlength=n_classes).astype(np.int64)
+    symptom_counts = np.zeros((n_classes, features.shape[1]), dtype=np.int64)
+    for class_index in np.flatnonzero(class_counts):
+        symptom_counts[class_index] = features[class_indices == class_index].sum(axis=0, dtype=np.int64)
+    return symptom_counts, class_counts
+
+
+def _normalize(probabilities):
+    totals = probabilities.sum(axis=-1, keepdims=True)
+    return np.divide(probabilities, totals, out=np.zeros_like(probabilities), where=totals > 0)
+
+
+class TriageEngine:
+    """Ranks unasked symptoms by expected information gain over the forest's classes"""
+
+    def __init__(self, forest, frequencies):
+        self.forest = forest
+        self.frequencies = frequencies  # P(symptom | class), one row per forest output column
+
+    @classmethod
+    def from_counts(cls, forest, symptom_counts, class_counts, smoothing=SMOOTHING):
+        """Build from count_by_class() output, indexed by class index like class_names"""
+        columns = np.asarray(forest.classes, dtype=np.intp)  # class index of each output column
+        counts = np.asarray(symptom_counts, dtype=np.float64)[columns]
+        totals = np.asarray(class_counts, dtype=np.float64)[columns]
+        frequencies = (counts + smoothing) / (totals[:, None] + 2 * smoothing)
+        return cls(forest, frequencies)
+
+    @classmethod
+    def from_dataset(cls, forest, class_names, data, smoothing=SMOOTHING):
+        """Build from a labelled dataset (see dataset.py) with the model's symptom columns"""
+        index_of = {str(name): i for i, name in enumerate(class_names)}
+        class_indices = np.array([index_of.get(str(label), -1) for label in data.labels], dtype=np.intp)
+        known = class_indices >= 0
+        symptom_counts, class_counts = count_by_class(
+            np.asarray(data.features)[known], class_indices[known], len(class_names)
+        )
+        return cls.from_counts(forest, symptom_counts, class_counts, smoothing)
+
+    def suggest(self, present, absent=(), top_k=5):
+        """Rank candidate questions for present/absent feature column indices"""
+        n_features = self.frequencies.shape[1]
+        present = sorted(set(present))
+        absent = sorted(set(absent) - set(present))
+        asked = set(present) | set(absent)
+        candidates = np.array([j for j in range(n_features) if j not in asked], dtype=np.intp)
+
+        # Row 0 is the current symptom set, row 1 + i adds candidate i
+        features = np.zeros((len(candidates) + 1, n_features), dtype=np.uint8)
+        features[:, present] = 1
+        features[np.arange(1, len(candidates) + 1), candidates] = 1
+        probabilities = self.forest.predict_proba(features)
+
+        # Denied symptoms reweight every branch the same way
+        if absent:
+            probabilities = _normalize(probabilities * np.prod(1 - self.frequencies[:, absent], axis=1))
+
+        posterior = probabilities[0]
+        current_entropy = float(entropy(posterior))
+        if not len(candidates):
+            return TriageResult(posterior, current_entropy, [])
+
+        candidate_frequencies = self.frequencies[:, candidates]  # (classes, candidates)
+        p_yes = posterior @ candidate_frequencies
+        if_yes = probabilities[1:]
+        if_no = _normalize(posterior[None, :] * (1 - candidate_frequencies.T))
+
+        expected_entropy = p_yes * entropy(if_yes) + (1 - p_yes) * entropy(if_no)
+        gain = current_entropy - expected_entropy
+
+        top_k = max(0, min(top_k, len(candidates)))
+        order = np.argsort(-gain, kind='stable')[:top_k]
+        suggestions = [Suggestion(int(candidates[i]), float(gain[i]), float(p_yes[i])) for i in order]
+        return TriageResult(posterior, current_entropy, suggestions)
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+Hyperparameter search and evaluation for the disease model.
+
+Runs the notebook's grid (n_estimators x max_depth x min_samples_split,
+stratified k-fold, macro F1) as a script, and for every candidate also fits
+on the full training data and reports accuracy and F1 on Testing.csv,
+inference latency and model size. The candidate with the smallest, then
+fastest, model that keeps the current parameters' scores is written to
+model_params.json, which training.py uses for every refit.
+
+Work is reused rather than repeated:
+  - for each (max_depth, min_samples_split, fold) only the largest forest is
+    fitted. With a fixed random_state the first k trees of a forest are
+    exactly the k-tree forest, so every smaller n_estimators is scored on a
+    prefix of it
+  - each fitted forest is checkpointed under .tuning_cache/ with its scores,
+    keyed by the data files' hashes. A later run reuses the scores, and a
+    larger n_estimators only fits the missing trees (warm_start)
+
+    python tuning.py
+    python tuning.py --n-estimators 25 50 100 --max-depth none 20 --no-write
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import training
+from dataset import file_stats, load_dataset
+from forest_engine import CHUNK_ROWS, FlatForest, export_forest
+from model_bundle import write_bundle
+
+TESTING_PATH = 'Testing.csv'
+TUNING_CACHE_DIR = '.tuning_cache'
+RESULTS_PATH = 'tuning_results.json'
+
+# Same grid and cross-validation as in the notebook, plus smaller forests
+N_ESTIMATORS_GRID = [25, 50, 100, 250, 500]
+MAX_DEPTH_GRID = [None, 10, 20]
+MIN_SAMPLES_SPLIT_GRID = [2, 5]
+CV_FOLDS = 5
+CV_RANDOM_STATE = 99
+
+LATENCY_REPEATS = 200  # single-row predictions timed per candidate
+TOLERANCE = 0.0  # score drop from the current parameters still accepted
+
+
+def data_key(folds):
+    """Hash of everything a checkpoint depends on besides the parameters"""
+    paths = [training.TRAINING_PATH, training.EXTRA_TRAINING_PATH, TESTING_PATH]
+    hashes = [file_stats(path)[0] if os.path.exists(path) else None for path in paths]
+    return hashlib.sha256(json.dumps([hashes, folds, CV_RANDOM_STATE]).encode('utf-8')).hexdigest()[:16]
+
+
+def _checkpoint_paths(key, max_depth, min_samples_split, fold):
+    name = f"{key}-d{max_depth}-s{min_samples_split}-{fold}"
+    return os.path.join(TUNING_CACHE_DIR, name + '.pkl'), os.path.join(TUNING_CACHE_DIR, name + '.json')
+
+
+def load_scores(key, max_depth, min_samples_split, fold):
+    """Checkpointed scores by n_estimators (as strings), empty if none"""
+    _, scores_path = _checkpoint_paths(key, max_depth, min_samples_split, fold)
+    try:
+        with open(scores_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_checkpoint(key, max_depth, min_samples_split, fold, model, scores):
+    """Write the forest, then its scores (the scores file marks it complete)"""
+    os.makedirs(TUNING_CACHE_DIR, exist_ok=True)
+    model_path, scores_path = _checkpoint_paths(key, max_depth, min_samples_split, fold)
+    training.save_pickle(model, model_path)
+
+    fd, temp_path = tempfile.mkstemp(dir=TUNING_CACHE_DIR, prefix='.scores-')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(scores, f)
+    os.replace(temp_path, scores_path)
+
+
+def _load_checkpoint_model(key, max_depth, min_samples_split, fold):
+    model_path, _ = _checkpoint_paths(key, max_depth, min_samples_split, fold)
+    try:
+        with open(model_path, 'rb') as f:
+            return pickle.load(f)
+    except Exception:
+        return None
+
+
+def prefix_forest(forest, n_trees):
+    """The first n_trees trees of a FlatForest as a compact FlatForest"""
+    if n_trees >= forest.n_trees:
+        return forest
+    end = forest.roots[n_trees]
+    return FlatForest(
+        forest.feature[:end], forest.threshold[:end], forest.left[:end], forest.right[:end],
+        forest.value[:end], forest.roots[:n_trees], forest.max_depth, forest.classes
+    )
+
+
+def model_size(forest, classes, symptoms):
+    """Size in bytes of the model bundle the app would load"""
+    fd, path = tempfile.mkstemp(prefix='tuning-', suffix='.bundle')
+    os.close(fd)
+    try:
+        write_bundle(path, forest, classes, symptoms)
+        return os.path.getsize(path)
+    finally:
+        os.remove(path)
+
+
+def measure_latency(forest, X, repeats=LATENCY_REPEATS):
+    """Median single-row and whole-batch prediction times in ms"""
+    # Untimed: build the leaf bitsets and warm the caches, so every candidate is timed the same way
+    forest.prepare()
+    forest.predict_proba(X[:CHUNK_ROWS])
+
+    rows = X[np.arange(repeats) % len(X)]
+    single = []
+    for row in rows:
+        started = time.perf_counter()
+        forest.predict_proba(row)
+        single.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    forest.predict_proba(X)
+    batch = time.perf_counter() - started
+    return float(np.median(single)) * 1000, batch * 1000
+
+
+def score(y_true, y_pred):
+    from sklearn.metrics import accuracy_score, f1_score
+
+    return {
+        'accuracy': round(float(accuracy_score(y_true, y_pred)), 6),
+        'f1_macro': round(float(f1_score(y_true, y_pred, average='macro')), 6)
+    }
+
+
+def fit_group(key, max_depth, min_samples_split, fold, sizes, folds):
+    """Fit (or grow) one forest and score every size in sizes on its prefixes
+
+    fold is a fold index, or 'test' to fit on all training data and evaluate
+    on Testing.csv with latency and model size.
+    """
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.model_selection import StratifiedKFold
+    from sklearn.preprocessing import LabelEncoder
+
+    data = training.load_training_data()
+    X = np.asarray(data.features)
+    encoder = LabelEncoder().fit(data.labels)
+    y = encoder.transform(data.labels)
+
+    if fold == 'test':
+        testing = load_dataset(TESTING_PATH)
+        train_index = np.arange(len(y))
+        X_eval = np.asarray(testing.features)
+        y_eval = encoder.transform(testing.labels)
+    else:
+        splitter = StratifiedKFold(n_splits=folds, shuffle=True, random_state=CV_RANDOM_STATE)
+        train_index, eval_index = list(splitter.split(X, y))[fold]
+        X_eval, y_eval = X[eval_index], y[eval_index]
+
+    scores = load_scores(key, max_depth, min_samples_split, fold)
+    largest = max(sizes)
+
+    # Grow the checkpointed forest when it has fewer trees than needed
+    model = _load_checkpoint_model(key, max_depth, min_samples_split, fold)
+    if model is not None and len(model.estimators_) < largest:
+        model.set_params(warm_start=True, n_estimators=largest, n_jobs=1)
+        model.fit(X[train_index], y[train_index])
+    elif model is None:
+        model = RandomForestClassifier(
+            n_estimators=largest,
+            max_depth=max_depth,
+            min_samples_split=min_samples_split,
+            random_state=training.RANDOM_STATE,
+            n_jobs=1
+        )
+        model.fit(X[train_index], y[train_index])
+    model.set_params(warm_start=False)
+
+    forest = export_forest(model)
+    for n_estimators in sizes:
+        subset = prefix_forest(forest, n_estimators)
+        result = score(y_eval, subset.predict_proba(X_eval).argmax(axis=1))
+        if fold == 'test':
+            single_ms, batch_ms = measure_latency(subset, X_eval.astype(np.float32))
+            result.update({
+                'latency_p50_ms': round(single_ms, 4),
+                'batch_ms': round(batch_ms, 4),
+                'n_nodes': int(subset.n_nodes),
+                'size_bytes': model_size(subset, encoder.classes_, data.symptoms)
+            })
+        scores[str(n_estimators)] = result
+
+    _save_checkpoint(key, max_depth, min_samples_split, fold, model, scores)
+    return scores
+
+
+def run_search(n_estimators_grid, max_depth_grid, min_samples_split_grid, folds=CV_FOLDS, workers=None, report=print):
+    """Score every candidate, fitting only what the checkpoints lack; returns a list of candidates"""
+    key = data_key(folds)
+    groups = [(d, s) for d in max_depth_grid for s in min_samples_split_grid]
+    parts = list(range(folds)) + ['test']
+
+    # Only groups missing a size are fitted; the rest come from the checkpoints
+    pending = []
+    for max_depth, min_samples_split in groups:
+        for fold in parts:
+            cached = load_scores(key, max_depth, min_samples_split, fold)
+            if any(str(n) not in cached for n in n_estimators_grid):
+                pending.append((max_depth, min_samples_split, fold))
+    report(f"{len(groups) * len(parts) - len(pending)} of {len(groups) * len(parts)} forests already scored in {TUNING_CACHE_DIR}/")
+
+    if pending:
+        started = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            futures = [
+                pool.submit(fit_group, key, d, s, fold, sorted(n_estimators_grid), folds)
+                for d, s, fold in pending
+            ]
+            for done, future in enumerate(futures, 1):
+                future.result()
+                report(f"fitted {done}/{len(futures)} forests ({time.perf_counter() - started:.1f}s)")
+
+    candidates = []
+    for max_depth, min_samples_split in groups:
+        fold_scores = [load_scores(key, max_depth, min_samples_split, fold) for fold in range(folds)]
+        test_scores = load_scores(key, max_depth, min_samples_split, 'test')
+        for n_estimators in n_estimators_grid:
+            cv = [scores[str(n_estimators)] for scores in fold_scores]
+            candidates.append({
+                'params': {
+                    'n_estimators': n_estimators,
+                    'max_depth': max_depth,
+                    'min_samples_split': min_samples_split
+                },
+                'cv_f1_macro': round(float(np.mean([s['f1_macro'] for s in cv])), 6),
+                'cv_f1_macro_std': round(float(np.std([s['f1_macro'] for s in cv])), 6),
+                'cv_accuracy': round(float(np.mean([s['accuracy'] for s in cv])), 6),
+                'test': test_scores[str(n_estimators)]
+            })
+    return candidates
+
+
+def select(candidates, baseline_params, tolerance=TOLERANCE):
+    """Smallest, then fastest, candidate scoring at least as well as the baseline parameters"""
+    baseline = next(c for c in candidates if c['params'] == baseline_params)
+    keeps_scores = [
+        c for c in candidates
+        if c['cv_f1_macro'] >= baseline['cv_f1_macro'] - tolerance
+        and c['test']['accuracy'] >= baseline['test']['accuracy'] - tolerance
+        and c['test']['f1_macro'] >= baseline['test']['f1_macro'] - tolerance
+    ]
+    best = min(keeps_scores, key=lambda c: (c['test']['size_bytes'], c['test']['latency_p50_ms']))
+    return best, baseline
+
+
+def write_params(best, path=training.MODEL_PARAMS_PATH):
+    """Save the chosen parameters for training.py, with the scores they were chosen on"""
+    params = dict(best['params'], random_state=training.RANDOM_STATE)
+    params['tuning'] = {key: value for key, value in best.items() if key != 'params'}
+    params['tuning']['created'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix='.params-')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(params, f, indent=2)
+        f.write('\n')
+    os.replace(temp_path, path)
+
+
+def print_table(candidates, best, baseline):
+    print(f"{'n_est':>6} {'depth':>5} {'split':>5} {'cv_f1':>8} {'test_acc':>8} {'test_f1':>8} "
+          f"{'p50_ms':>8} {'size_kb':>9}")
+    for c in candidates:
+        p, t = c['params'], c['test']
+        mark = ' <- selected' if c is best else ' <- current' if c is baseline else ''
+        print(f"{p['n_estimators']:>6} {str(p['max_depth']):>5} {p['min_samples_split']:>5} "
+              f"{c['cv_f1_macro']:>8.4f} {t['accuracy']:>8.4f} {t['f1_macro']:>8.4f} "
+              f"{t['latency_p50_ms']:>8.3f} {t['size_bytes'] / 1024:>9.1f}{mark}")
+
+
+def parse_depth(value):
+    return None if value.lower() == 'none' else int(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--n-estimators', type=int, nargs='+', default=N_ESTIMATORS_GRID)
+    parser.add_argument('--max-depth', type=parse_depth, nargs='+', default=MAX_DEPTH_GRID, help="use 'none' for unlimited")
+    parser.add_argument('--min-samples-split', type=int, nargs='+', default=MIN_SAMPLES_SPLIT_GRID)
+    parser.add_argument('--folds', type=int, default=CV_FOLDS)
+    parser.add_argument('--workers', type=int, help='parallel fits (default: one per CPU)')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help='accepted score drop from the current parameters')
+    parser.add_argument('--output', default=RESULTS_PATH, help='JSON file for all candidates')
+    parser.add_argument('--no-write', action='store_true', help=f'do not update {training.MODEL_PARAMS_PATH}')
+    args = parser.parse_args()
+
+    # The parameters training uses now are the bar to keep
+    current = training.load_model_params()
+    baseline_params = {key: current[key] for key in ('n_estimators', 'max_depth', 'min_samples_split')}
+    n_estimators_grid = sorted(set(args.n_estimators) | {baseline_params['n_estimators']})
+    max_depth_grid = list(dict.fromkeys(args.max_depth + [baseline_params['max_depth']]))
+    min_samples_split_grid = sorted(set(args.min_samples_split) | {baseline_params['min_samples_split']})
+
+    candidates = run_search(n_estimators_grid, max_depth_grid, min_samples_split_grid, args.folds, args.workers)
+    best, baseline = select(candidates, baseline_params, args.tolerance)
+    print_table(candidates, best, baseline)
+
+    with open(args.output, 'w') as f:
+        json.dump({'baseline': baseline, 'selected': best, 'candidates': candidates}, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if not args.no_write:
+        write_params(best)
+        print(f"Selected parameters written to {training.MODEL_PARAMS_PATH}: {best['params']}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
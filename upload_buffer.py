@@ -0,0 +1,186 @@
+"""
+Uploaded files held in memory, spooled to disk only when large.
+
+Uploads up to the spool threshold stay in a bytes buffer for the whole
+upload -> OCR path. Larger ones, and PDFs (poppler reads from a file), are
+written to a private directory (mode 0700, unique per upload) that is
+removed with everything in it by cleanup(). Concurrent uploads never share
+a file name.
+
+SpoolFile is the stream werkzeug parses a multipart upload into. It rolls
+over into the same kind of private directory, and UploadBuffer.from_stream()
+takes that file over as it is, so a large upload is written to disk once.
+"""
+
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+
+READ_CHUNK = 1 << 20
+
+
+class SpoolFile(io.RawIOBase):
+    """Write target for an upload: memory up to threshold bytes, then a file in a private temp dir
+
+    Closing it removes the temp dir, unless an UploadBuffer has taken the
+    file over.
+    """
+
+    def __init__(self, threshold, spool_dir=None):
+        self.threshold = threshold
+        self.spool_dir = spool_dir
+        self.temp_dir = None
+        self.path = None
+        self._file = io.BytesIO()
+
+    @property
+    def in_memory(self):
+        return self.path is None
+
+    def _rollover(self):
+        self.temp_dir = tempfile.mkdtemp(prefix='upload-', dir=self.spool_dir)
+        self.path = os.path.join(self.temp_dir, 'upload')
+        spooled = open(self.path, 'w+b')
+        spooled.write(self._file.getbuffer())
+        self._file = spooled
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def write(self, data):
+        if self.in_memory and self._file.tell() + len(data) > self.threshold:
+            self._rollover()
+        return self._file.write(data)
+
+    def read(self, size=-1):
+        return self._file.read(size)
+
+    def readinto(self, buffer):
+        return self._file.readinto(buffer)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self._file.seek(offset, whence)
+
+    def tell(self):
+        return self._file.tell()
+
+    def getvalue(self):
+        return self._file.getvalue()
+
+    def detach_file(self):
+        """Hand the spooled file over to the caller, who must remove temp_dir"""
+        temp_dir, path = self.temp_dir, self.path
+        self._file.close()
+        self.temp_dir = None
+        return temp_dir, path
+
+    def close(self):
+        if not self.closed:
+            self._file.close()
+            if self.temp_dir is not None:
+                shutil.rmtree(self.temp_dir, ignore_errors=True)
+                self.temp_dir = None
+        super().close()
+
+
+class UploadBuffer:
+    """An uploaded file, either as bytes in memory or as a file in a private temp dir"""
+
+    def __init__(self, filename, data=None, spool_dir=None):
+        self.filename = filename
+        self.data = data
+        self.spool_dir = spool_dir  # parent for the private temp dir
+        self._temp_dir = None
+        self._path = None
+
+    @classmethod
+    def from_stream(cls, stream, filename, threshold, spool_dir=None):
+        """Read a stream, keeping it in memory unless it grows past threshold bytes"""
+        if isinstance(stream, SpoolFile):
+            return cls.from_spool(stream, filename)
+
+        upload = cls(filename, spool_dir=spool_dir)
+        buffer = bytearray()
+
+        while True:
+            chunk = stream.read(READ_CHUNK)
+            if not chunk:
+                upload.data = bytes(buffer)
+                return upload
+            buffer += chunk
+            if len(buffer) > threshold:
+                break
+
+        # Too large for memory: continue straight into a private file
+        try:
+            with open(upload._new_path(), 'wb') as f:
+                f.write(buffer)
+                del buffer
+                shutil.copyfileobj(stream, f, READ_CHUNK)
+        except BaseException:
+            upload.cleanup()
+            raise
+        return upload
+
+    @classmethod
+    def from_spool(cls, spool, filename):
+        """Take over a SpoolFile's bytes, or its spooled file without copying it"""
+        upload = cls(filename, spool_dir=spool.spool_dir)
+        if spool.in_memory:
+            upload.data = spool.getvalue()
+            return upload
+
+        upload._temp_dir, spooled_path = spool.detach_file()
+        upload._path = os.path.join(upload._temp_dir, filename or 'upload')
+        os.replace(spooled_path, upload._path)
+        return upload
+
+    @property
+    def in_memory(self):
+        return self.data is not None
+
+    @property
+    def size(self):
+        return len(self.data) if self.in_memory else os.path.getsize(self._path)
+
+    def _new_path(self):
+        self._temp_dir = tempfile.mkdtemp(prefix='upload-', dir=self.spool_dir)
+        self._path = os.path.join(self._temp_dir, self.filename or 'upload')
+        return self._path
+
+    def content_hash(self):
+        """SHA-256 of the uploaded bytes"""
+        digest = hashlib.sha256()
+        if self.in_memory:
+            digest.update(self.data)
+        else:
+            with open(self._path, 'rb') as f:
+                for chunk in iter(lambda: f.read(READ_CHUNK), b''):
+                    digest.update(chunk)
+        return digest.hexdigest()
+
+    def path(self):
+        """A file path holding the upload, spooling it to disk if it is in memory"""
+        if self._path is None:
+            with open(self._new_path(), 'wb') as f:
+                f.write(self.data)
+        return self._path
+
+    def source(self):
+        """The bytes if in memory, else the file path (both accepted by the OCR helpers)"""
+        return self.data if self.in_memory else self._path
+
+    def cleanup(self):
+        """Remove the private temp dir, if one was created"""
+        if self._temp_dir is not None:
+            shutil.rmtree(self._temp_dir, ignore_errors=True)
+            self._temp_dir = None
+            self._path = None